@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+端到端性能测试
+启动本地模拟的 JavLibrary 和 Plex 服务器，对每种处理引擎和线程数在独立进程中完整运行 main()，
+输出每秒处理的视频数、每个视频的请求数、各阶段耗时 p50/p99 和峰值内存
+
+用法: python benchmarks/bench_e2e.py [--videos 200] [--engines threads,async,pipeline] [--threads 1,4,8]
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import yaml
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+from fake_servers import FakeJavLibrary, FakePlex, library_files  # noqa: E402
+
+# 阶段名 -> PlexJAVUpdater 的方法（三种引擎都通过这些方法处理视频）
+STAGES = {
+    'extract': 'resolve_code',
+    'scrape': 'scrape',
+    'cover': 'prepare_cover',
+    'apply': 'apply_metadata',
+    'collections': 'flush_collections',
+}
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_worker(result_path: str, main_args):
+    """子进程：为各阶段计时后运行 main()，把结果写入 JSON 文件"""
+    import jav_meta_updater
+
+    timings = {stage: [] for stage in STAGES}
+
+    def timed(stage, method):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timings[stage].append(time.perf_counter() - start)
+        return wrapper
+
+    for stage, name in STAGES.items():
+        setattr(jav_meta_updater.PlexJAVUpdater, name,
+                timed(stage, getattr(jav_meta_updater.PlexJAVUpdater, name)))
+
+    sys.argv = ['jav_meta_updater.py', *main_args]
+    start = time.perf_counter()
+    jav_meta_updater.main()
+    elapsed = time.perf_counter() - start
+
+    try:
+        import resource
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            peak_rss_kb //= 1024  # macOS 单位为字节
+    except ImportError:
+        peak_rss_kb = 0
+
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump({'elapsed': elapsed, 'timings': timings, 'peak_rss_kb': peak_rss_kb}, f)
+
+
+def write_config(workdir: Path, javlibrary: FakeJavLibrary, plex: FakePlex, args, engine: str, threads: int) -> Path:
+    """生成指向模拟服务器的配置文件，缓存和状态都放在临时目录中"""
+    config = {
+        'plex': {'url': plex.base_url, 'token': 'benchmark', 'library': plex.library, 'page_size': 200},
+        'javlibrary': {
+            'base_url': javlibrary.base_url,
+            'language': 'cn',
+            'timeout': 10,
+            'rate_limit': args.rate_limit,
+            'burst': args.burst,
+            'max_retries': 3,
+            'parser': args.parser,
+            'session_file': 'cache/cf_session.json',
+        },
+        'cache': {'enabled': True, 'path': 'cache/javlibrary.db'},
+        'covers': {'path': 'cache/covers'},
+        'state': {'path': 'cache/state.db'},
+        # 线程数同时作为异步引擎和流水线引擎各阶段的并发数
+        'engine': {
+            'type': engine,
+            'scrape_workers': threads,
+            'resolve_workers': threads,
+            'cover_workers': threads,
+            'apply_workers': threads,
+            'plex_workers': threads,
+        },
+        'rules': {'download_covers': True, 'upload_covers_from_file': args.covers},
+    }
+    path = workdir / 'config.yaml'
+    with open(path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    return path
+
+
+def run_case(javlibrary: FakeJavLibrary, plex: FakePlex, args, engine: str, threads: int, workdir: Path,
+             extra_args=()):
+    """在子进程中运行一次 main()，返回结果统计"""
+    javlibrary.reset_counters()
+    plex.reset_counters()
+    config = write_config(workdir, javlibrary, plex, args, engine, threads)
+    result_path = workdir / 'result.json'
+    if result_path.exists():
+        result_path.unlink()
+
+    command = [sys.executable, str(Path(__file__).resolve()), '--worker', str(result_path), '--',
+               '--config', str(config), '--threads', str(threads), *extra_args]
+    with open(workdir / 'run.log', 'a', encoding='utf-8') as log:
+        completed = subprocess.run(command, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    if completed.returncode != 0 or not result_path.exists():
+        raise RuntimeError(f"运行失败（{engine}, {threads} 线程），日志: {workdir / 'run.log'}")
+
+    with open(result_path, encoding='utf-8') as f:
+        result = json.load(f)
+    result['javlibrary_requests'] = dict(javlibrary.requests)
+    result['plex_requests'] = dict(plex.requests)
+    return result
+
+
+def report_row(label: str, videos: int, result) -> str:
+    jav_requests = sum(result['javlibrary_requests'].values())
+    plex_requests = sum(result['plex_requests'].values())
+    stages = ' '.join(
+        f"{stage}={percentile(values, 0.5) * 1000:.0f}/{percentile(values, 0.99) * 1000:.0f}"
+        for stage, values in result['timings'].items() if values
+    )
+    return (f"{label:<22}{videos / result['elapsed']:>10.1f}{jav_requests / videos:>10.2f}"
+            f"{plex_requests / videos:>10.2f}{result['peak_rss_kb'] / 1024:>10.1f}  {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端性能测试（本地模拟 JavLibrary 和 Plex）')
+    parser.add_argument('--videos', type=int, default=200, help='模拟库中的视频数量')
+    parser.add_argument('--engines', default='threads,async,pipeline', help='要测试的引擎，逗号分隔')
+    parser.add_argument('--threads', default='1,4,8', help='要测试的线程数，逗号分隔')
+    parser.add_argument('--latency', type=float, default=0.05, help='JavLibrary 请求延迟（秒）')
+    parser.add_argument('--plex-latency', type=float, default=0.002, help='Plex 请求延迟（秒）')
+    parser.add_argument('--forbidden-rate', type=float, default=0.02, help='随机返回 403 的比例')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='随机返回 429 的比例（429 重试固定等待 5 秒以上，会显著拉长运行时间）')
+    parser.add_argument('--redirect-rate', type=float, default=0.5, help='搜索直接跳转到详情页的比例')
+    parser.add_argument('--miss-rate', type=float, default=0.05, help='搜索不到的番号比例')
+    parser.add_argument('--rate-limit', type=float, default=0, help='javlibrary.rate_limit，0 表示不限速')
+    parser.add_argument('--burst', type=int, default=1, help='javlibrary.burst')
+    parser.add_argument('--parser', default='auto', help='详情页解析后端')
+    parser.add_argument('--covers', action='store_true', help='预先下载封面并以文件上传（测试封面阶段）')
+    parser.add_argument('--warm', action='store_true', help='每种配置再用 --full 运行一次（缓存命中、无需修改）')
+    parser.add_argument('--keep', action='store_true', help='保留临时目录（包含运行日志）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args, rest = parser.parse_known_args()
+
+    if args.worker:
+        run_worker(args.worker, [arg for arg in rest if arg != '--'])
+        return 0
+
+    files = library_files(args.videos, seed=args.seed)
+    javlibrary = FakeJavLibrary(latency=args.latency, forbidden_rate=args.forbidden_rate,
+                                throttle_rate=args.throttle_rate, redirect_rate=args.redirect_rate,
+                                miss_rate=args.miss_rate, seed=args.seed).start()
+    plex = FakePlex(files, latency=args.plex_latency).start()
+    root = Path(tempfile.mkdtemp(prefix='jav_bench_'))
+
+    print(f"视频数: {args.videos}, JavLibrary 延迟: {args.latency * 1000:.0f}ms, "
+          f"403: {args.forbidden_rate:.0%}, 429: {args.throttle_rate:.0%}, 跳转: {args.redirect_rate:.0%}, "
+          f"未找到: {args.miss_rate:.0%}, 限速间隔: {args.rate_limit}s")
+    print(f"{'引擎/线程':<22}{'视频/秒':>10}{'JL请求/个':>10}{'Plex请求/个':>10}{'峰值MB':>10}  "
+          f"阶段耗时 p50/p99 (ms)")
+
+    failures = 0
+    try:
+        for engine in args.engines.split(','):
+            for threads in (int(value) for value in args.threads.split(',')):
+                workdir = root / f'{engine}-{threads}'
+                workdir.mkdir()
+                plex.reset()
+                try:
+                    result = run_case(javlibrary, plex, args, engine, threads, workdir)
+                    print(report_row(f'{engine}/{threads}', args.videos, result), flush=True)
+                    if args.warm:
+                        result = run_case(javlibrary, plex, args, engine, threads, workdir, ['--full'])
+                        print(report_row(f'{engine}/{threads} (warm)', args.videos, result), flush=True)
+                except RuntimeError as e:
+                    failures += 1
+                    print(f"❌ {e}")
+    finally:
+        javlibrary.stop()
+        plex.stop()
+        if args.keep or failures:
+            print(f"\n运行目录: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
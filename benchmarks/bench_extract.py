@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+番号提取性能测试
+生成一批接近真实媒体库的文件路径，比较原实现与预编译实现每秒处理的文件数，并校验两者结果完全一致
+
+用法: python benchmarks/bench_extract.py [--files 100000]
+"""
+
+import re
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jav_meta_updater import JAVNumberExtractor  # noqa: E402
+
+PREFIXES = ['SSIS', 'ABP', 'MIDE', 'IPX', 'CJOD', 'STARS', 'PRED', 'JUL', 'MEYD', 'FC2', 'SNIS', 'AP',
+            'MOON', 'HEYZO', 'DASD', 'EBOD', 'WANZ', 'PPPD', 'JUFD', 'ADN', 'SDDE', 'HND', 'KAWD', 'VEC']
+TITLES = ['图书馆夫妇戴绿帽子', '只要是乳交就不算', '与偶像共度的极上时光', '交わる体液、濃密セックス',
+          'uncensored leaked', '中文字幕', '4K', 'FHD', '完全主观', '新人出道']
+ROOTS = ['/media/jav', '/mnt/nas/Videos/JAV', 'D:\\Media\\JAV', '/volume1/video/成人', '/data/downloads/complete']
+EXTENSIONS = ['.mp4', '.mkv', '.avi', '.wmv', '.MP4', '.ts']
+
+
+def legacy_extract(filename: str):
+    """原实现（每次调用都重新拼接正则）"""
+    full_path = str(filename).upper()
+
+    parts = re.split(r'[/\\]', full_path)
+    for part in parts:
+        first_space_pos = part.find(' ')
+        if first_space_pos > 0:
+            potential_code = part[:first_space_pos].strip()
+            for pattern in JAVNumberExtractor.PATTERNS:
+                match = re.match(f'^{pattern}$', potential_code)
+                if match:
+                    return f"{match.group(1)}-{match.group(2)}"
+
+    filename_only = Path(filename).stem.upper()
+    first_space_pos = filename_only.find(' ')
+    if first_space_pos > 0:
+        potential_code = filename_only[:first_space_pos].strip()
+        for pattern in JAVNumberExtractor.PATTERNS:
+            match = re.match(f'^{pattern}$', potential_code)
+            if match:
+                return f"{match.group(1)}-{match.group(2)}"
+
+    for pattern in JAVNumberExtractor.PATTERNS:
+        match = re.search(pattern, full_path)
+        if match:
+            return f"{match.group(1)}-{match.group(2)}"
+
+    return None
+
+
+def random_path(rng: random.Random) -> str:
+    """生成一个文件路径，覆盖常见命名方式和少量无番号的文件"""
+    prefix = rng.choice(PREFIXES)
+    number = f"{rng.randint(1, 999):03d}"
+    sep = rng.choice(['-', '-', '-', '_', '.', '', ' '])
+    code = f"{prefix}{sep}{number}"
+    if rng.random() < 0.5:
+        code = code.lower()
+    title = rng.choice(TITLES)
+    ext = rng.choice(EXTENSIONS)
+    root = rng.choice(ROOTS)
+    slash = '\\' if root.startswith('D:') else '/'
+
+    style = rng.randrange(7)
+    if style == 0:
+        name = f"{code}{ext}"
+    elif style == 1:
+        name = f"{code} {title}{ext}"
+    elif style == 2:
+        name = f"{code} {title}{slash}video{ext}"
+    elif style == 3:
+        name = f"[{rng.choice(['jav', 'hd', '2048'])}]{code}-C{ext}"
+    elif style == 4:
+        name = f"{prefix}{slash}{code}{slash}{code}-cd{rng.randint(1, 2)}{ext}"
+    elif style == 5:
+        name = f"{title} {rng.randint(2015, 2024)}{slash}{title}{ext}"  # 无番号
+    else:
+        name = f"{rng.randint(100000, 999999)}_{rng.randint(100, 999)}-1pon{ext}"
+    return f"{root}{slash}{name}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='番号提取性能测试')
+    parser.add_argument('--files', type=int, default=100000, help='生成的文件路径数量')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    paths = [random_path(rng) for _ in range(args.files)]
+
+    start = time.perf_counter()
+    expected = [legacy_extract(path) for path in paths]
+    legacy_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    uncached = [JAVNumberExtractor.extract_uncached(path) for path in paths]
+    uncached_elapsed = time.perf_counter() - start
+
+    JAVNumberExtractor._extract_cached.cache_clear()
+    start = time.perf_counter()
+    cold = JAVNumberExtractor.extract_many(paths)
+    cold_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm = JAVNumberExtractor.extract_many(paths)
+    warm_elapsed = time.perf_counter() - start
+
+    for name, results in (('预编译', uncached), ('extract_many', cold), ('extract_many(缓存)', warm)):
+        mismatches = [(path, old, new) for path, old, new in zip(paths, expected, results) if old != new]
+        if mismatches:
+            print(f"❌ {name} 与原实现结果不一致 ({len(mismatches)} 个)，例如:")
+            for path, old, new in mismatches[:5]:
+                print(f"   {path}: {old} != {new}")
+            return 1
+
+    found = sum(1 for code in expected if code)
+    print(f"\n文件数: {len(paths)}, 提取到番号: {found}, 结果与原实现一致")
+    print(f"{'实现':<24}{'文件/秒':>14}{'加速比':>10}")
+    for name, elapsed in (('原实现', legacy_elapsed),
+                          ('预编译', uncached_elapsed),
+                          ('extract_many（冷缓存）', cold_elapsed),
+                          ('extract_many（热缓存）', warm_elapsed)):
+        print(f"{name:<24}{len(paths) / elapsed:>14.0f}{legacy_elapsed / elapsed:>9.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+详情页解析性能测试
+对 fixtures/ 中保存的详情页，比较各解析后端每秒能解析的页面数，并校验结果与完整页面解析一致
+
+用法: python benchmarks/bench_parse.py [--iterations 200]
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bs4 import BeautifulSoup  # noqa: E402
+from jav_meta_updater import (  # noqa: E402
+    JavLibraryScraper, PARSER_BACKENDS, available_parser_backends, parse_detail_html
+)
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+BASE_URL = 'https://www.javlibrary.com'
+
+
+def load_fixtures():
+    """读取详情页样本，番号取自文件名（detail_abp_123.html -> ABP-123）"""
+    fixtures = []
+    for path in sorted(FIXTURES_DIR.glob('detail_*.html')):
+        code = path.stem[len('detail_'):].upper().replace('_', '-')
+        fixtures.append((code, path.read_text(encoding='utf-8')))
+    return fixtures
+
+
+def measure(parse, fixtures, iterations: int) -> float:
+    """返回每秒解析的页面数"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for code, html in fixtures:
+            parse(html, code)
+    elapsed = time.perf_counter() - start
+    return iterations * len(fixtures) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='详情页解析性能测试')
+    parser.add_argument('--iterations', type=int, default=200, help='每个后端重复解析样本的轮数')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures()
+    if not fixtures:
+        print(f"未找到样本文件: {FIXTURES_DIR}")
+        return 1
+
+    scraper = JavLibraryScraper(base_url=BASE_URL)
+
+    def legacy(html, code):
+        return scraper._parse_detail_page(BeautifulSoup(html, 'html.parser'), code)
+
+    expected = {code: legacy(html, code) for code, html in fixtures}
+
+    rows = [('bs4 完整页面（原实现）', measure(legacy, fixtures, args.iterations))]
+    for backend in PARSER_BACKENDS:
+        if backend not in available_parser_backends():
+            print(f"跳过未安装的后端: {backend}")
+            continue
+
+        def parse(html, code, backend=backend):
+            return parse_detail_html(html, code, BASE_URL, backend)
+
+        for code, html in fixtures:
+            result = parse(html, code)
+            if result != expected[code]:
+                print(f"❌ {backend} 解析 {code} 的结果与完整页面解析不一致:")
+                print(f"   期望: {expected[code]}")
+                print(f"   实际: {result}")
+                return 1
+        rows.append((f'{backend} 子树解析', measure(parse, fixtures, args.iterations)))
+
+    baseline = rows[0][1]
+    print(f"\n样本: {len(fixtures)} 个详情页, 每个后端 {args.iterations} 轮")
+    print(f"{'后端':<24}{'页面/秒':>12}{'加速比':>10}")
+    for name, rate in rows:
+        print(f"{name:<24}{rate:>12.1f}{rate / baseline:>9.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+监听模式（--watch）测试
+用本地模拟的通知源按时间表推送库扫描事件，经 LibraryWatcher.on_alert → 去抖/分批 → handler，
+输出每种场景的批次数、批大小和从视频处理完成到交给 handler 的延迟 p50/p99，
+并校验没有遗漏视频、没有混入其他库或未处理完成的条目、批大小和等待时间不超过上限
+
+用法: python benchmarks/bench_watch.py [--items 200] [--debounce 0.2] [--batch-size 50] [--max-wait 1.0]
+"""
+
+import sys
+import time
+import logging
+import argparse
+import threading
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+import jav_meta_updater  # noqa: E402
+from jav_meta_updater import LibraryWatcher  # noqa: E402
+from fake_servers import FakeAlertSource, scan_events, timeline_event  # noqa: E402
+
+SECTION_ID = 2
+OTHER_SECTION_ID = 9
+PROCESSED_STATE = 5
+TOLERANCE = 0.25  # 线程调度带来的额外延迟上限（秒）
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def noise_events(duration: float, count: int = 20):
+    """不应触发处理的通知：其他库、非电影条目、播放状态和后台任务消息"""
+    events = []
+    for index in range(count):
+        offset = duration * index / count
+        events.append((offset, timeline_event(OTHER_SECTION_ID, 900000 + index, PROCESSED_STATE)))
+        events.append((offset, timeline_event(SECTION_ID, 910000 + index, PROCESSED_STATE, item_type=4)))
+        events.append((offset, {'type': 'playing', 'PlaySessionStateNotification': [{'ratingKey': str(index)}]}))
+        events.append((offset, {'type': 'activity', 'ActivityNotification': [{'event': 'progress'}]}))
+    return events
+
+
+def scenarios(args):
+    """场景名 -> (说明, 事件列表, 应交给 handler 的 ratingKey)"""
+    items = args.items
+    burst = list(range(1, items + 1))
+    # 同一视频重新扫描会再次收到处理完成的通知
+    rescans = [(0.003 + index * 0.002, timeline_event(SECTION_ID, key, PROCESSED_STATE))
+               for index, key in enumerate(burst[::10])]
+    trickle_interval = args.debounce * 0.5
+    trickle = list(range(10001, 10001 + max(1, int(args.max_wait * 3 / trickle_interval))))
+    sparse = list(range(20001, 20011))
+    sparse_interval = args.debounce * 2 + TOLERANCE
+    return {
+        'burst': (f'{items} 个视频在 {items * 0.002:.1f} 秒内扫描完成（按批大小分批，余下的去抖后处理）',
+                  scan_events(SECTION_ID, burst, interval=0.002) + rescans + noise_events(items * 0.002),
+                  set(burst)),
+        'trickle': (f'每 {trickle_interval:.2f} 秒一个视频（通知不间断，按最长等待时间出批）',
+                    scan_events(SECTION_ID, trickle, interval=trickle_interval)
+                    + noise_events(len(trickle) * trickle_interval),
+                    set(trickle)),
+        'sparse': (f'每 {sparse_interval:.2f} 秒一个视频（每个视频去抖后单独处理）',
+                   scan_events(SECTION_ID, sparse, interval=sparse_interval)
+                   + noise_events(len(sparse) * sparse_interval),
+                   set(sparse)),
+    }
+
+
+def run_scenario(events, expected, args):
+    """运行 LibraryWatcher 直到全部视频交给 handler（或超时），返回批次和每个视频的延迟"""
+    batches = []
+    received_at = {}
+
+    def handler(batch):
+        now = time.monotonic()
+        batches.append(list(batch))
+        for key in batch:
+            received_at.setdefault(key, now)
+
+    updater = SimpleNamespace(library=SimpleNamespace(key=SECTION_ID, title='模拟库'))
+    source = FakeAlertSource(events)
+    watcher = LibraryWatcher(updater, handler, debounce=args.debounce, batch_size=args.batch_size,
+                             max_wait=args.max_wait, processed_states=(PROCESSED_STATE,), event_source=source)
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+
+    timeout = events[-1][0] + args.max_wait + args.debounce + 5
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not (source.finished.is_set() and expected <= received_at.keys()):
+        time.sleep(0.01)
+    # 推送结束后再等一个去抖周期，确认没有多余的批次
+    time.sleep(args.debounce + TOLERANCE)
+    watcher.stop()
+    thread.join(timeout=5)
+
+    # 延迟从视频第一次收到处理完成通知算起
+    completed_at = {}
+    for sent_at, data in source.sent:
+        for entry in data.get('TimelineEntry', []):
+            if (str(entry['sectionID']) == str(SECTION_ID) and entry['type'] == 1
+                    and entry['state'] == PROCESSED_STATE):
+                completed_at.setdefault(int(entry['itemID']), sent_at)
+    latencies = [received_at[key] - completed_at[key] for key in received_at if key in completed_at]
+    return batches, latencies
+
+
+def check(batches, latencies, expected, args):
+    """返回发现的问题列表"""
+    problems = []
+    delivered = Counter(key for batch in batches for key in batch)
+    missing = expected - delivered.keys()
+    unexpected = delivered.keys() - expected
+    if missing:
+        problems.append(f"遗漏 {len(missing)} 个视频: {sorted(missing)[:5]}")
+    if unexpected:
+        problems.append(f"混入 {len(unexpected)} 个不应处理的条目: {sorted(unexpected)[:5]}")
+    oversized = [len(batch) for batch in batches if len(batch) > args.batch_size]
+    if oversized:
+        problems.append(f"批大小超过 {args.batch_size}: {oversized}")
+    if latencies and max(latencies) > args.max_wait + TOLERANCE:
+        problems.append(f"最长等待 {max(latencies):.2f}s 超过 max_wait {args.max_wait}s")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='监听模式测试（本地模拟 Plex 通知）')
+    parser.add_argument('--items', type=int, default=200, help='burst 场景中的视频数量')
+    parser.add_argument('--debounce', type=float, default=0.2, help='LibraryWatcher.debounce（秒）')
+    parser.add_argument('--batch-size', type=int, default=50, help='LibraryWatcher.batch_size')
+    parser.add_argument('--max-wait', type=float, default=1.0, help='LibraryWatcher.max_wait（秒）')
+    parser.add_argument('--scenarios', default='burst,trickle,sparse', help='要运行的场景，逗号分隔')
+    args = parser.parse_args()
+
+    jav_meta_updater.logger.setLevel(logging.WARNING)
+
+    print(f"debounce: {args.debounce}s, batch_size: {args.batch_size}, max_wait: {args.max_wait}s")
+    print(f"{'场景':<10}{'视频':>6}{'批次':>6}{'批大小 min/max':>16}{'重复':>6}  延迟 p50/p99/max (ms)")
+
+    failures = 0
+    available = scenarios(args)
+    for name in args.scenarios.split(','):
+        description, events, expected = available[name]
+        batches, latencies = run_scenario(events, expected, args)
+        sizes = [len(batch) for batch in batches] or [0]
+        duplicates = sum(len(batch) for batch in batches) - len({key for batch in batches for key in batch})
+        print(f"{name:<10}{len(expected):>6}{len(batches):>6}{f'{min(sizes)}/{max(sizes)}':>16}{duplicates:>6}  "
+              f"{percentile(latencies, 0.5) * 1000:.0f}/{percentile(latencies, 0.99) * 1000:.0f}/"
+              f"{max(latencies or [0]) * 1000:.0f}", flush=True)
+        print(f"{'':<10}{description}")
+        for problem in check(batches, latencies, expected, args):
+            failures += 1
+            print(f"{'':<10}❌ {problem}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,439 @@
+"""
+本地模拟服务器：用于离线性能测试
+- FakeJavLibrary: 用 fixtures/ 中的详情页模板响应搜索和详情页请求，可配置延迟、403/429 注入和搜索跳转
+- FakePlex: 实现 PlexJAVUpdater 用到的库列表、批量获取、编辑和封面上传接口，编辑结果保存在内存中
+- FakeAlertSource: 按时间表推送 Plex 通知（库扫描 timeline 事件），代替 AlertListener 测试 --watch
+"""
+
+import re
+import time
+import random
+import hashlib
+import threading
+from collections import Counter
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+from xml.sax.saxutils import quoteattr
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """把请求转给所属服务器的 handle()，使用 HTTP/1.1 长连接"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # 响应头和正文分开写出，否则长连接上每个请求多等一个延迟 ACK
+
+    def _dispatch(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, headers, payload = self.server.owner.handle(self.command, self.path, self.headers, body)
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = _dispatch
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeServer:
+    """在后台线程运行的 HTTP 服务器，按路由统计请求数"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, route: str):
+        with self._lock:
+            self.requests[route] += 1
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, method: str, path: str, headers, body: bytes):
+        raise NotImplementedError
+
+
+def video_id_for(code: str) -> str:
+    """番号对应的详情页 ID（?v= 参数），与真实站点一样是不透明的字符串"""
+    return 'jav' + hashlib.sha1(code.encode('utf-8')).hexdigest()[:8]
+
+
+class FakeJavLibrary(FakeServer):
+    """模拟 JavLibrary
+
+    latency: 每个请求的基础延迟（秒），实际延迟在 0.5~1.5 倍之间随机
+    forbidden_rate / throttle_rate: 随机返回 403 / 429 的比例
+    redirect_rate: 搜索时直接 302 跳转到详情页（而不是返回搜索结果页）的比例
+    miss_rate: 搜索不到的番号比例
+    """
+
+    def __init__(self, latency: float = 0.05, forbidden_rate: float = 0.0, throttle_rate: float = 0.0,
+                 redirect_rate: float = 0.5, miss_rate: float = 0.0, seed: int = 42, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.forbidden_rate = forbidden_rate
+        self.throttle_rate = throttle_rate
+        self.redirect_rate = redirect_rate
+        self.miss_rate = miss_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._codes = {}  # 详情页 ID -> 番号
+        self.templates = self._load_templates()
+        self.cover = self._make_cover()
+
+    @staticmethod
+    def _load_templates():
+        """读取详情页样本，记录每个样本自身的番号和详情页 ID，响应时替换为请求的番号"""
+        templates = []
+        for path in sorted(FIXTURES_DIR.glob('detail_*.html')):
+            html = path.read_text(encoding='utf-8')
+            code = path.stem[len('detail_'):].upper().replace('_', '-')
+            match = re.search(r'\?v=([\w]+)', html)
+            templates.append((code, match.group(1) if match else None, html))
+        if not templates:
+            raise RuntimeError(f"未找到详情页样本: {FIXTURES_DIR}")
+        return templates
+
+    @staticmethod
+    def _make_cover() -> bytes:
+        """生成一张 800x538 的封面（未安装 Pillow 时返回随机字节）"""
+        try:
+            from io import BytesIO
+            from PIL import Image
+            buffer = BytesIO()
+            Image.new('RGB', (800, 538), (90, 120, 160)).save(buffer, 'JPEG', quality=85)
+            return buffer.getvalue()
+        except ImportError:
+            return random.Random(0).randbytes(60 * 1024)
+
+    def _chance(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < rate
+
+    def _delay(self):
+        if self.latency > 0:
+            with self._rng_lock:
+                factor = self._rng.uniform(0.5, 1.5)
+            time.sleep(self.latency * factor)
+
+    def _is_miss(self, code: str) -> bool:
+        # 按番号确定是否搜索不到，重复运行时结果一致
+        digest = int(hashlib.sha1(b'miss:' + code.encode('utf-8')).hexdigest()[:8], 16)
+        return digest / 0xFFFFFFFF < self.miss_rate
+
+    def _redirects(self, code: str) -> bool:
+        digest = int(hashlib.sha1(b'redirect:' + code.encode('utf-8')).hexdigest()[:8], 16)
+        return digest / 0xFFFFFFFF < self.redirect_rate
+
+    def detail_page(self, code: str) -> str:
+        """用样本生成指定番号的详情页"""
+        index = int(hashlib.sha1(code.encode('utf-8')).hexdigest()[:8], 16) % len(self.templates)
+        template_code, template_id, html = self.templates[index]
+        video_id = video_id_for(code)
+        html = html.replace(template_code, code)
+        if template_id:
+            html = html.replace(template_id, video_id)
+        # 封面指向本服务器
+        return re.sub(r'src="(?:https?:)?//pics\.dmm\.co\.jp/[^"]+"', f'src="{self.base_url}/pics/{video_id}.jpg"', html)
+
+    def search_page(self, codes) -> str:
+        """搜索结果页：列出多个相近番号（与真实站点一样，结果里可能包含其他番号）"""
+        items = ''.join(
+            f'<div class="video" id="vid_{video_id_for(code)}"><a href="./?v={video_id_for(code)}" title="{code}">'
+            f'<div class="id">{code}</div><div class="title">{code} 标题</div></a></div>'
+            for code in codes
+        )
+        return (f'<html><head><title>识别码搜寻结果 - JAVLibrary</title></head><body>'
+                f'<div class="videothumblist"><div class="videos">{items}</div></div></body></html>')
+
+    def handle(self, method, path, headers, body):
+        url = urlsplit(path)
+        query = dict(parse_qsl(url.query))
+        self._delay()
+
+        if url.path.startswith('/pics/'):
+            self.count('cover')
+            return 200, {'Content-Type': 'image/jpeg'}, self.cover
+
+        if self._chance(self.forbidden_rate):
+            self.count('403')
+            return 403, {'Content-Type': 'text/html'}, b'<html><title>Just a moment...</title></html>'
+        if self._chance(self.throttle_rate):
+            self.count('429')
+            return 429, {'Content-Type': 'text/html', 'Retry-After': '5'}, b'Too Many Requests'
+
+        lang = url.path.strip('/').split('/')[0] if url.path.strip('/') else ''
+        prefix = f'/{lang}' if lang and not lang.endswith('.php') else ''
+
+        if url.path.endswith('/vl_searchbyid.php'):
+            self.count('search')
+            code = query.get('keyword', '').strip().upper()
+            if not code or self._is_miss(code):
+                return 200, {'Content-Type': 'text/html; charset=utf-8'}, self.search_page([]).encode('utf-8')
+            self._codes[video_id_for(code)] = code
+            if self._redirects(code):
+                return 302, {'Location': f'{prefix}/?v={video_id_for(code)}'}, b''
+            # 同系列相邻番号一起出现在结果中
+            series, _, number = code.partition('-')
+            codes = [code]
+            if number.isdigit():
+                codes += [f'{series}-{int(number) + offset:0{len(number)}d}' for offset in (1, 2)]
+            for other in codes:
+                self._codes[video_id_for(other)] = other
+            return 200, {'Content-Type': 'text/html; charset=utf-8'}, self.search_page(codes).encode('utf-8')
+
+        if 'v' in query:
+            self.count('detail')
+            code = self._codes.get(query['v'])
+            if not code:
+                return 404, {'Content-Type': 'text/html'}, b'Not Found'
+            etag = '"' + hashlib.sha1(code.encode('utf-8')).hexdigest()[:16] + '"'
+            if headers.get('If-None-Match') == etag:
+                self.count('304')
+                return 304, {'ETag': etag}, b''
+            return 200, {'Content-Type': 'text/html; charset=utf-8', 'ETag': etag}, \
+                self.detail_page(code).encode('utf-8')
+
+        self.count('other')
+        return 404, {'Content-Type': 'text/html'}, b'Not Found'
+
+
+# 编辑参数中的标签类型 -> XML 元素名
+TAG_ELEMENTS = {'genre': 'Genre', 'actor': 'Role', 'collection': 'Collection', 'director': 'Director',
+                'label': 'Label', 'writer': 'Writer', 'country': 'Country'}
+
+
+class FakePlex(FakeServer):
+    """模拟 Plex Media Server 的一个电影库
+
+    files: 库中视频的文件路径列表，ratingKey 从 1 开始
+    latency: 每个请求的延迟（秒）
+    """
+
+    MACHINE_ID = 'benchmark-plex'
+    SECTION_KEY = '1'
+
+    def __init__(self, files, library: str = 'JAV', latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.library = library
+        self.latency = latency
+        self.files = list(files)
+        self.edits = Counter()  # 编辑请求涉及的视频数
+        self._store_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """恢复为未整理的初始库"""
+        now = int(time.time()) - 3600
+        with self._store_lock:
+            self.items = {}
+            for index, file in enumerate(self.files, start=1):
+                self.items[index] = {
+                    'title': Path(file).stem, 'file': file, 'addedAt': now + index, 'updatedAt': now + index,
+                    'fields': {}, 'tags': {}, 'thumb': f'/library/metadata/{index}/thumb/{now}',
+                }
+        self.edits.clear()
+        self.reset_counters()
+
+    def _video_xml(self, key: int, item: dict) -> str:
+        attrs = {
+            'ratingKey': str(key), 'key': f'/library/metadata/{key}', 'type': 'movie', 'title': item['title'],
+            'librarySectionID': self.SECTION_KEY, 'librarySectionKey': f'/library/sections/{self.SECTION_KEY}',
+            'librarySectionTitle': self.library, 'addedAt': str(item['addedAt']),
+            'updatedAt': str(item['updatedAt']), 'thumb': item['thumb'],
+        }
+        attrs.update(item['fields'])
+        tags = ''.join(f'<{element} tag={quoteattr(tag)} />'
+                       for element, values in item['tags'].items() for tag in values)
+        return (f'<Video {" ".join(f"{name}={quoteattr(str(value))}" for name, value in attrs.items())}>'
+                f'<Media id="{key}"><Part id="{key}" key="/library/parts/{key}/file.mp4" '
+                f'file={quoteattr(item["file"])} /></Media>{tags}</Video>')
+
+    @staticmethod
+    def _container(body: str = '', **attrs) -> bytes:
+        attributes = ' '.join(f'{name}={quoteattr(str(value))}' for name, value in attrs.items())
+        return f'<?xml version="1.0" encoding="UTF-8"?><MediaContainer {attributes}>{body}</MediaContainer>'.encode('utf-8')
+
+    def _apply_edit(self, params: dict):
+        """按 Plex 编辑接口的规则修改视频：单个视频时标签整体替换，多个视频时标签追加"""
+        keys = [int(key) for key in params.get('id', '').split(',') if key]
+        single = len(keys) == 1
+        fields, added, removed = {}, {}, {}
+        for name, value in params.items():
+            match = re.match(r'^(\w+)\[(\d*)\]\.tag\.tag(-?)$', name)
+            if match:
+                element = TAG_ELEMENTS.get(match.group(1), match.group(1).capitalize())
+                target = removed if match.group(3) else added
+                target.setdefault(element, []).extend(value.split(',') if match.group(3) else [value])
+            elif name.endswith('.value'):
+                fields[name[:-len('.value')]] = value
+        now = int(time.time())
+        with self._store_lock:
+            for key in keys:
+                item = self.items.get(key)
+                if not item:
+                    continue
+                item['fields'].update(fields)
+                if 'title' in fields:
+                    item['title'] = fields['title']
+                for element, values in added.items():
+                    current = [] if single else item['tags'].get(element, [])
+                    item['tags'][element] = current + [tag for tag in values if tag not in current]
+                for element, values in removed.items():
+                    item['tags'][element] = [tag for tag in item['tags'].get(element, []) if tag not in values]
+                item['updatedAt'] = now
+                self.edits[key] += 1
+
+    def handle(self, method, path, headers, body):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        url = urlsplit(path)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        route = url.path
+        xml = {'Content-Type': 'text/xml;charset=utf-8'}
+
+        if route in ('/', ''):
+            self.count('server')
+            return 200, xml, self._container(machineIdentifier=self.MACHINE_ID, friendlyName='benchmark',
+                                             version='1.40.0.0', platform='Linux')
+        if route == '/library':
+            self.count('library')
+            return 200, xml, self._container(title1='Plex Library')
+        if route == '/library/sections':
+            self.count('sections')
+            directory = (f'<Directory key="{self.SECTION_KEY}" type="movie" title={quoteattr(self.library)} '
+                         f'agent="tv.plex.agents.none" scanner="Plex Video Files Scanner" language="xx" '
+                         f'uuid="00000000-0000-0000-0000-000000000001"><Location id="1" path="/media" /></Directory>')
+            return 200, xml, self._container(directory, size=1)
+
+        if route == f'/library/sections/{self.SECTION_KEY}/all':
+            if method == 'PUT':
+                self.count('edit')
+                self._apply_edit(params)
+                return 200, xml, self._container()
+            self.count('list')
+            start = int(headers.get('X-Plex-Container-Start') or params.get('X-Plex-Container-Start') or 0)
+            size = int(headers.get('X-Plex-Container-Size') or params.get('X-Plex-Container-Size') or 50)
+            since = int(params.get('updatedAt>>', 0) or 0)
+            with self._store_lock:
+                matched = [(key, item) for key, item in sorted(self.items.items()) if item['updatedAt'] > since]
+                page = ''.join(self._video_xml(key, item) for key, item in matched[start:start + size])
+            return 200, xml, self._container(page, size=min(size, max(0, len(matched) - start)),
+                                             totalSize=len(matched), offset=start)
+
+        match = re.match(r'^/library/metadata/([\d,]+)(/posters)?$', route)
+        if match:
+            keys = [int(key) for key in match.group(1).split(',')]
+            if match.group(2):
+                self.count('poster')
+                with self._store_lock:
+                    for key in keys:
+                        if key in self.items:
+                            self.items[key]['thumb'] = f'/library/metadata/{key}/thumb/upload://posters/{len(body)}'
+                return 200, xml, self._container()
+            self.count('metadata')
+            with self._store_lock:
+                videos = ''.join(self._video_xml(key, self.items[key]) for key in keys if key in self.items)
+            return 200, xml, self._container(videos, size=len(keys))
+
+        self.count('other')
+        return 404, xml, self._container()
+
+
+def timeline_event(section_id, item_id, state: int, item_type: int = 1):
+    """一条库扫描通知（与 AlertListener 收到的 timeline 消息结构相同）"""
+    return {'type': 'timeline', 'size': 1, 'TimelineEntry': [{
+        'identifier': 'com.plexapp.plugins.library', 'sectionID': str(section_id), 'itemID': str(item_id),
+        'type': item_type, 'state': state, 'updatedAt': int(time.time()),
+    }]}
+
+
+def scan_events(section_id, item_ids, start: float = 0.0, interval: float = 0.01,
+                states=(0, 1, 5), step: float = 0.001):
+    """模拟库扫描：每隔 interval 秒发现一个新视频，依次推送 states 中的状态（5 表示元数据处理完成）"""
+    events = []
+    for index, item_id in enumerate(item_ids):
+        offset = start + index * interval
+        events += [(offset + n * step, timeline_event(section_id, item_id, state)) for n, state in enumerate(states)]
+    return events
+
+
+class FakeAlertSource:
+    """模拟 Plex 通知连接：在后台线程按时间表调用回调
+
+    events: [(相对开始推送的秒数, 通知数据), ...]
+    可直接作为 LibraryWatcher 的 event_source：以回调调用时开始推送并返回自身；
+    推送完后连接保持打开（is_alive() 为 True）直到 stop()，不会触发重连
+    """
+
+    def __init__(self, events):
+        self.events = sorted(events, key=lambda event: event[0])
+        self.sent = []  # (推送时的 time.monotonic(), 通知数据)
+        self.finished = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __call__(self, callback):
+        self._thread = threading.Thread(target=self._replay, args=(callback,), daemon=True)
+        self._thread.start()
+        return self
+
+    def _replay(self, callback):
+        start = time.monotonic()
+        for offset, data in self.events:
+            if self._stopped.wait(max(0.0, start + offset - time.monotonic())):
+                return
+            self.sent.append((time.monotonic(), data))
+            callback(data)
+        self.finished.set()
+
+    def is_alive(self) -> bool:
+        return not self._stopped.is_set()
+
+    def stop(self):
+        self._stopped.set()
+
+
+def library_files(count: int, seed: int = 42, multipart_rate: float = 0.05):
+    """生成媒体库文件路径：各系列的连续番号，少量分段视频（CD1/CD2 对应同一番号）"""
+    rng = random.Random(seed)
+    series = ['ABP', 'SSIS', 'MIDE', 'IPX', 'STARS', 'PRED', 'JUL', 'MEYD', 'SNIS', 'DASD', 'EBOD', 'PPPD']
+    files = []
+    number = 0
+    while len(files) < count:
+        number += 1
+        code = f"{series[number % len(series)]}-{100 + number // len(series):03d}"
+        if rng.random() < multipart_rate and len(files) + 1 < count:
+            files += [f"/media/jav/{code}/{code}-cd{part}.mp4" for part in (1, 2)]
+        else:
+            files.append(f"/media/jav/{code}/{code} 标题.mp4")
+    return files[:count]
@@ -34,8 +34,9 @@ check_config() {
 
 # 创建必要目录
 create_dirs() {
-    mkdir -p logs
+    mkdir -p logs cache
     print_message "✅ 创建日志目录：logs/" $GREEN
+    print_message "✅ 创建缓存目录：cache/" $GREEN
 }
 
 # 构建镜像
@@ -77,6 +78,7 @@ run_interactive() {
         --name jav-updater-interactive \
         -v "$(pwd)/config.yaml:/app/config.yaml:ro" \
         -v "$(pwd)/logs:/app/logs" \
+        -v "$(pwd)/cache:/app/cache" \
         javplex:latest "$@"
 }
 
@@ -87,6 +89,7 @@ run_daemon() {
         --name jav-updater-daemon \
         -v "$(pwd)/config.yaml:/app/config.yaml:ro" \
         -v "$(pwd)/logs:/app/logs" \
+        -v "$(pwd)/cache:/app/cache" \
         javplex:latest "$@"
     
     print_message "✅ 容器已在后台启动" $GREEN
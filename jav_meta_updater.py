@@ -6,21 +6,66 @@ JAV Metadata Updater for Plex
 
 import re
 import time
+import json
+import asyncio
+import sqlite3
 import logging
 import argparse
+import threading
+import queue
+import zlib
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Iterator, Union, Callable
+from urllib.parse import urlparse
+from collections import namedtuple, Counter
 import yaml
 from plexapi.server import PlexServer
+from plexapi import utils
 from plexapi.exceptions import NotFound
+from plexapi.mixins import EditTagsMixin
+import hashlib
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
 import cloudscraper
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat, islice
+from contextlib import contextmanager
+from functools import lru_cache
 from tqdm import tqdm
 import os
 import tempfile
 
+try:
+    import fcntl
+except ImportError:  # Windows 不支持跨进程共享限速
+    fcntl = None
+
+# 可选的高性能 HTML 解析后端
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser as SelectolaxParser
+    except ImportError:
+        SelectolaxParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from PIL import Image  # 可选：封面裁剪/缩放/重新压缩
+except ImportError:
+    Image = None
+
+try:
+    import websocket  # noqa: F401  plexapi 的 AlertListener 依赖 websocket-client，仅 --watch 需要
+except ImportError:
+    websocket = None
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -46,75 +91,1068 @@ class JAVNumberExtractor:
         r'([A-Z]{2,5})[-_]([A-Z]\d{2,4})',  # 特殊格式: ABC-A123
     ]
     
+    # 预编译的完整匹配交替表达式：按 PATTERNS 顺序尝试，每个格式占两个分组
+    _FULL_MATCH = re.compile('^(?:' + '|'.join(f'(?:{pattern})' for pattern in PATTERNS) + ')$')
+    # 在整个路径中搜索时格式优先级高于匹配位置，所以保持按顺序逐个搜索
+    _SEARCHES = [re.compile(pattern) for pattern in PATTERNS]
+    _PATH_SEPARATORS = re.compile(r'[/\\]')
+    
+    @classmethod
+    def _match_code(cls, potential_code: str) -> Optional[str]:
+        """完整匹配任意一种番号格式"""
+        match = cls._FULL_MATCH.match(potential_code)
+        if match:
+            # 匹配到的格式的两个分组是最后两个分组
+            return f"{match.group(match.lastindex - 1)}-{match.group(match.lastindex)}"
+        return None
+    
     @classmethod
     def extract(cls, filename: str) -> Optional[str]:
+        """从文件名中提取番号（按路径缓存结果）"""
+        return cls._extract_cached(str(filename))
+    
+    @classmethod
+    def extract_many(cls, filenames) -> List[Optional[str]]:
+        """批量提取番号，结果顺序与输入一致"""
+        return [cls._extract_cached(str(filename)) for filename in filenames]
+    
+    @staticmethod
+    @lru_cache(maxsize=131072)
+    def _extract_cached(filename: str) -> Optional[str]:
+        return JAVNumberExtractor.extract_uncached(filename)
+    
+    @classmethod
+    def extract_uncached(cls, filename: str) -> Optional[str]:
         """从文件名中提取番号"""
         # 获取完整路径用于搜索（转换为大写）
         full_path = str(filename).upper()
         
         # 策略1: 在路径中查找空格前的番号（适用于 "CJOD-160 title" 这种格式）
-        # 分割路径，检查每个部分
-        parts = re.split(r'[/\\]', full_path)  # 分割路径
-        for part in parts:
-            first_space_pos = part.find(' ')
-            if first_space_pos > 0:
-                potential_code = part[:first_space_pos].strip()
-                for pattern in cls.PATTERNS:
-                    match = re.match(f'^{pattern}$', potential_code)
-                    if match:
-                        prefix = match.group(1)
-                        number = match.group(2)
-                        return f"{prefix}-{number}"
-        
-        # 策略2: 获取最终文件名（不含扩展名）
-        filename_only = Path(filename).stem.upper()
-        first_space_pos = filename_only.find(' ')
-        if first_space_pos > 0:
-            potential_code = filename_only[:first_space_pos].strip()
-            for pattern in cls.PATTERNS:
-                match = re.match(f'^{pattern}$', potential_code)
-                if match:
-                    prefix = match.group(1)
-                    number = match.group(2)
-                    return f"{prefix}-{number}"
+        # 分割路径，检查每个部分。原先的策略2（最终文件名去掉扩展名后取空格前部分）
+        # 检查的是最后一个部分的前缀，已经包含在这里，不再单独处理
+        if ' ' in full_path:
+            for part in cls._PATH_SEPARATORS.split(full_path):
+                first_space_pos = part.find(' ')
+                if first_space_pos > 0:
+                    code = cls._match_code(part[:first_space_pos].strip())
+                    if code:
+                        return code
         
         # 策略3: 在整个路径中搜索任何符合格式的番号
-        for pattern in cls.PATTERNS:
-            match = re.search(pattern, full_path)
+        for pattern in cls._SEARCHES:
+            match = pattern.search(full_path)
             if match:
-                prefix = match.group(1)
-                number = match.group(2)
-                return f"{prefix}-{number}"
+                return f"{match.group(1)}-{match.group(2)}"
         
         return None
 
 
+# 详情页中包含元数据的子树，只解析这些部分
+DETAIL_SUBTREE_IDS = re.compile(r'^video_(title|jacket|info|genres|cast)$')
+
+
+def _extract_with_selectolax(html: str) -> Dict:
+    """使用 selectolax 从详情页子树中提取原始字段"""
+    tree = SelectolaxParser(html)
+    fields = {}
+    
+    node = tree.css_first('#video_title h3')
+    fields['title'] = node.text().strip() if node else ''
+    node = tree.css_first('#video_jacket img')
+    fields['cover_src'] = (node.attributes.get('src') or '') if node else ''
+    
+    info = tree.css_first('#video_info')
+    if info is None:
+        return fields
+    fields['info_text'] = info.text()
+    fields['genres'] = [a.text().strip() for a in info.css('span.genre a')]
+    fields['actors'] = [a.text().strip() for a in info.css('a[href*="vl_star.php"]')]
+    for key, pattern in (('maker', 'vl_maker.php'), ('label', 'vl_label.php')):
+        node = info.css_first(f'a[href*="{pattern}"]')
+        if node:
+            fields[key] = (node.text().strip(), node.attributes.get('href') or '')
+    node = info.css_first('span.score')
+    fields['score'] = node.text().strip() if node else ''
+    return fields
+
+
+def _extract_with_lxml(html: str) -> Dict:
+    """使用 lxml 从详情页子树中提取原始字段"""
+    root = lxml.html.fromstring(html)
+    fields = {}
+    
+    nodes = root.xpath('//div[@id="video_title"]//h3')
+    fields['title'] = nodes[0].text_content().strip() if nodes else ''
+    nodes = root.xpath('//div[@id="video_jacket"]//img')
+    fields['cover_src'] = nodes[0].get('src', '') if nodes else ''
+    
+    infos = root.xpath('//div[@id="video_info"]')
+    if not infos:
+        return fields
+    info = infos[0]
+    fields['info_text'] = info.text_content()
+    fields['genres'] = [a.text_content().strip() for a in
+                        info.xpath('.//span[contains(concat(" ", @class, " "), " genre ")]//a')]
+    fields['actors'] = [a.text_content().strip() for a in info.xpath('.//a[contains(@href, "vl_star.php")]')]
+    for key, pattern in (('maker', 'vl_maker.php'), ('label', 'vl_label.php')):
+        nodes = info.xpath(f'.//a[contains(@href, "{pattern}")]')
+        if nodes:
+            fields[key] = (nodes[0].text_content().strip(), nodes[0].get('href', ''))
+    nodes = info.xpath('.//span[contains(concat(" ", @class, " "), " score ")]')
+    fields['score'] = nodes[0].text_content().strip() if nodes else ''
+    return fields
+
+
+def _extract_with_bs4(html: str) -> Dict:
+    """使用 BeautifulSoup 只解析详情页子树并提取原始字段"""
+    features = 'lxml' if lxml is not None else 'html.parser'
+    soup = BeautifulSoup(html, features, parse_only=SoupStrainer(id=DETAIL_SUBTREE_IDS))
+    fields = {}
+    
+    node = soup.select_one('#video_title h3')
+    fields['title'] = node.text.strip() if node else ''
+    node = soup.select_one('#video_jacket img')
+    fields['cover_src'] = node.get('src', '') if node else ''
+    
+    info = soup.select_one('#video_info')
+    if info is None:
+        return fields
+    fields['info_text'] = info.text
+    fields['genres'] = [a.text.strip() for a in info.select('span.genre a')]
+    fields['actors'] = [a.text.strip() for a in info.select('a[href*="vl_star.php"]')]
+    for key, pattern in (('maker', 'vl_maker.php'), ('label', 'vl_label.php')):
+        node = info.select_one(f'a[href*="{pattern}"]')
+        if node:
+            fields[key] = (node.text.strip(), node.get('href', ''))
+    node = info.select_one('span.score')
+    fields['score'] = node.text.strip() if node else ''
+    return fields
+
+
+PARSER_BACKENDS = {
+    'selectolax': _extract_with_selectolax,
+    'lxml': _extract_with_lxml,
+    'bs4': _extract_with_bs4,
+}
+
+
+def available_parser_backends() -> List[str]:
+    """已安装的解析后端，按性能从高到低排列"""
+    available = {
+        'selectolax': SelectolaxParser is not None,
+        'lxml': lxml is not None,
+        'bs4': True,
+    }
+    return [backend for backend in PARSER_BACKENDS if available[backend]]
+
+
+def resolve_parser_backend(name: str = 'auto') -> str:
+    """选择可用的解析后端，auto 按 selectolax > lxml > bs4 的顺序选择"""
+    available = available_parser_backends()
+    if name == 'auto':
+        return available[0]
+    if name not in available:
+        logger.warning(f"解析后端 {name} 不可用，改用 bs4")
+        return 'bs4'
+    return name
+
+
+def parse_detail_html(html: str, code: str, base_url: str, backend: str = 'bs4') -> Optional[Dict]:
+    """解析详情页 HTML，只处理元数据所在的子树
+    
+    页面结构不符合预期（找不到标题/类别/演员）时返回 None，
+    由调用方退回到完整页面的多选择器解析。
+    """
+    fields = PARSER_BACKENDS[backend](html)
+    if not any([fields.get('title'), fields.get('genres'), fields.get('actors')]):
+        return None
+    
+    metadata = {
+        'code': code,
+        'title': fields.get('title', ''),
+        'genres': fields.get('genres', []),
+        'actors': fields.get('actors', []),
+        'studio': '',
+        'director': '',
+        'release_date': '',
+        'rating': 0,
+        'cover_url': '',
+        'maker_page': '',
+        'label_page': ''
+    }
+    
+    src = fields.get('cover_src', '')
+    if src.startswith('//'):
+        metadata['cover_url'] = 'https:' + src
+    elif src.startswith('/'):
+        metadata['cover_url'] = base_url + src
+    else:
+        metadata['cover_url'] = src
+    
+    # 制作商优先，发行商备选
+    for key in ('maker', 'label'):
+        if key in fields:
+            name, href = fields[key]
+            metadata[f'{key}_page'] = href.lstrip('./')
+            if not metadata['studio']:
+                metadata['studio'] = name
+    
+    date_match = re.search(r'(\d{4}-\d{2}-\d{2})', fields.get('info_text', ''))
+    if date_match:
+        metadata['release_date'] = date_match.group(1)
+    
+    try:
+        metadata['rating'] = float(fields.get('score', '').strip('()'))
+    except ValueError:
+        pass
+    
+    return metadata
+
+
+CacheEntry = namedtuple('CacheEntry', ['metadata', 'fetched_at', 'etag', 'last_modified'])
+
+
+class MetadataCache:
+    """JavLibrary 元数据本地缓存（SQLite），包含正向缓存和未找到番号的负缓存"""
+    
+    def __init__(self, path: str = "cache/javlibrary.db",
+                 ttl: int = 30 * 86400,
+                 negative_ttl: int = 86400,
+                 store_html: bool = False):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl  # 元数据有效期（秒）
+        self.negative_ttl = negative_ttl  # 未找到记录的有效期（秒）
+        self.store_html = store_html  # 是否保存详情页原始 HTML（用于重新解析）
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS metadata ('
+                'code TEXT NOT NULL, language TEXT NOT NULL, data TEXT NOT NULL, '
+                'fetched_at REAL NOT NULL, etag TEXT, last_modified TEXT, PRIMARY KEY (code, language))'
+            )
+            # 旧版本缓存没有验证器字段
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(metadata)')}
+            for column in ('etag', 'last_modified'):
+                if column not in columns:
+                    self._conn.execute(f'ALTER TABLE metadata ADD COLUMN {column} TEXT')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS misses ('
+                'code TEXT NOT NULL, language TEXT NOT NULL, '
+                'checked_at REAL NOT NULL, PRIMARY KEY (code, language))'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS listing_pages ('
+                'prefix TEXT NOT NULL, language TEXT NOT NULL, page TEXT NOT NULL, '
+                'PRIMARY KEY (prefix, language))'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                'code TEXT NOT NULL, language TEXT NOT NULL, html BLOB NOT NULL, '
+                'fetched_at REAL NOT NULL, PRIMARY KEY (code, language))'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS detail_index ('
+                'code TEXT NOT NULL, language TEXT NOT NULL, video_id TEXT NOT NULL, '
+                'updated_at REAL NOT NULL, PRIMARY KEY (code, language))'
+            )
+            self._conn.commit()
+    
+    @staticmethod
+    def normalize_code(code: str) -> str:
+        """统一番号格式作为缓存键"""
+        return code.strip().upper()
+    
+    def get(self, code: str, language: str) -> Optional[Dict]:
+        """读取未过期的元数据，不存在或已过期返回 None"""
+        entry = self.get_entry(code, language)
+        if not entry or self.is_stale(entry):
+            return None
+        return entry.metadata
+    
+    def get_entry(self, code: str, language: str) -> Optional[CacheEntry]:
+        """读取元数据及详情页的 ETag/Last-Modified（包括已过期的记录）"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, fetched_at, etag, last_modified FROM metadata WHERE code = ? AND language = ?',
+                (self.normalize_code(code), language)
+            ).fetchone()
+        if not row:
+            return None
+        return CacheEntry(json.loads(row[0]), row[1], row[2], row[3])
+    
+    def is_stale(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.fetched_at > self.ttl
+    
+    def touch(self, code: str, language: str):
+        """详情页未变化（304）：只延长元数据有效期"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE metadata SET fetched_at = ? WHERE code = ? AND language = ?',
+                (time.time(), self.normalize_code(code), language)
+            )
+            self._conn.commit()
+    
+    @staticmethod
+    def code_prefix(code: str) -> str:
+        """番号前缀（系列）"""
+        return code.split('-')[0] if '-' in code else code[:3]
+    
+    def put(self, code: str, language: str, metadata: Dict, fetched_at: Optional[float] = None,
+            etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """写入元数据，同时清除该番号的负缓存；未提供验证器时保留原有的"""
+        key = self.normalize_code(code)
+        # 记录该系列所属的发行商/制作商列表页，优先使用范围更小的发行商
+        listing_page = metadata.get('label_page') or metadata.get('maker_page')
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO metadata (code, language, data, fetched_at, etag, last_modified) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (code, language) DO UPDATE SET '
+                'data = excluded.data, fetched_at = excluded.fetched_at, '
+                'etag = COALESCE(excluded.etag, etag), last_modified = COALESCE(excluded.last_modified, last_modified)',
+                (key, language, json.dumps(metadata, ensure_ascii=False), fetched_at or time.time(),
+                 etag, last_modified)
+            )
+            self._conn.execute('DELETE FROM misses WHERE code = ? AND language = ?', (key, language))
+            if listing_page:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO listing_pages (prefix, language, page) VALUES (?, ?, ?)',
+                    (self.code_prefix(key), language, listing_page)
+                )
+            self._conn.commit()
+    
+    def get_listing_page(self, prefix: str, language: str) -> Optional[str]:
+        """读取系列对应的发行商/制作商列表页"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT page FROM listing_pages WHERE prefix = ? AND language = ?',
+                (prefix.upper(), language)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def is_known_miss(self, code: str, language: str) -> bool:
+        """番号是否在负缓存有效期内被记录为未找到"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT checked_at FROM misses WHERE code = ? AND language = ?',
+                (self.normalize_code(code), language)
+            ).fetchone()
+        return bool(row) and time.time() - row[0] <= self.negative_ttl
+    
+    def put_miss(self, code: str, language: str):
+        """记录未找到的番号"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO misses (code, language, checked_at) VALUES (?, ?, ?)',
+                (self.normalize_code(code), language, time.time())
+            )
+            self._conn.commit()
+    
+    def put_page(self, code: str, language: str, html: str):
+        """保存详情页原始 HTML（zlib 压缩）"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (code, language, html, fetched_at) VALUES (?, ?, ?, ?)',
+                (self.normalize_code(code), language, zlib.compress(html.encode('utf-8')), time.time())
+            )
+            self._conn.commit()
+    
+    def iter_pages(self, language: str, batch_size: int = 256):
+        """分批读取保存的详情页，每批为 [(番号, HTML, 抓取时间), ...]"""
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT rowid, code, html, fetched_at FROM pages '
+                    'WHERE language = ? AND rowid > ? ORDER BY rowid LIMIT ?',
+                    (language, last_rowid, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield [(code, zlib.decompress(html).decode('utf-8'), fetched_at) for _, code, html, fetched_at in rows]
+    
+    def get_detail_id(self, code: str, language: str) -> Optional[str]:
+        """读取番号对应的详情页 ID（?v= 参数）"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT video_id FROM detail_index WHERE code = ? AND language = ?',
+                (self.normalize_code(code), language)
+            ).fetchone()
+        return row[0] if row else None
+    
+    def put_detail_ids(self, entries: Dict[str, str], language: str):
+        """批量记录番号到详情页 ID 的映射"""
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO detail_index (code, language, video_id, updated_at) VALUES (?, ?, ?, ?)',
+                [(self.normalize_code(code), language, video_id, now) for code, video_id in entries.items()]
+            )
+            self._conn.commit()
+    
+    def delete_detail_id(self, code: str, language: str):
+        """删除失效的详情页映射"""
+        with self._lock:
+            self._conn.execute(
+                'DELETE FROM detail_index WHERE code = ? AND language = ?',
+                (self.normalize_code(code), language)
+            )
+            self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CoverStore:
+    """封面本地存储：文件名为 URL 的哈希，跨视频、跨运行复用，超过容量时淘汰最久未使用的文件"""
+    
+    CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, path: str = "cache/covers", max_size_mb: float = 500,
+                 timeout: int = 30, pool_size: int = 8,
+                 referer: str = 'https://www.javlibrary.com/', user_agent: Optional[str] = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # 复用连接的会话，避免每张封面都重新建立 TLS 连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': user_agent or 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Referer': referer
+        })
+        self._size = sum(file.stat().st_size for file in self.path.glob('*.*') if file.is_file())
+    
+    def path_for(self, url: str) -> Path:
+        """封面 URL 对应的本地文件"""
+        suffix = Path(url.split('?')[0]).suffix.lower()
+        if suffix not in ('.jpg', '.jpeg', '.png', '.webp'):
+            suffix = '.jpg'
+        return self.path / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}{suffix}"
+    
+    def get(self, url: str) -> Optional[str]:
+        """返回封面本地路径，本地没有时流式下载"""
+        if not url:
+            return None
+        target = self.path_for(url)
+        try:
+            os.utime(target)  # 更新修改时间，作为 LRU 淘汰依据
+            logger.debug(f"封面命中本地缓存: {target.name}")
+            return str(target)
+        except FileNotFoundError:
+            pass  # 本地没有，或刚被其他线程的容量清理删除，重新下载
+        
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                if response.status_code != 200:
+                    logger.warning(f"封面下载失败: HTTP {response.status_code}")
+                    return None
+                # 先写入同目录的临时文件再原子替换，并发下载同一封面也不会读到不完整的文件
+                fd, temp_path = tempfile.mkstemp(dir=self.path, suffix='.part')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        for chunk in response.iter_content(self.CHUNK_SIZE):
+                            f.write(chunk)
+                    os.replace(temp_path, target)
+                except BaseException:
+                    os.unlink(temp_path)
+                    raise
+        except Exception as e:
+            logger.error(f"下载封面失败: {e}")
+            return None
+        
+        logger.info(f"封面下载成功: {target.name}")
+        self.register(target)
+        return str(target)
+    
+    def register(self, file: Path):
+        """记录新写入的文件大小，超过容量时淘汰旧文件"""
+        with self._lock:
+            self._size += Path(file).stat().st_size
+            if self._size > self.max_size:
+                self._evict()
+    
+    def _evict(self):
+        """按修改时间从旧到新删除文件，直到低于容量的 90%"""
+        files = sorted((file for file in self.path.glob('*.*') if file.suffix != '.part'),
+                       key=lambda file: file.stat().st_mtime)
+        self._size = sum(file.stat().st_size for file in files)
+        removed = 0
+        for file in files:
+            if self._size <= self.max_size * 0.9:
+                break
+            try:
+                size = file.stat().st_size
+                file.unlink()
+            except FileNotFoundError:
+                continue
+            self._size -= size
+            removed += 1
+        logger.info(f"封面缓存超过容量，已清理 {removed} 个文件")
+    
+    def close(self):
+        self.session.close()
+
+
+# JavLibrary 的封面是 背面|书脊|正面 的完整外盒，海报取右侧正面部分，宽高比约 1:1.42
+POSTER_ASPECT = 0.705
+
+
+def process_cover_image(source: str, target: str, max_width: int, max_height: int,
+                        quality: int, crop_poster: bool) -> str:
+    """裁剪出海报部分、缩放并重新压缩封面（模块级函数，可在进程池中执行）"""
+    with Image.open(source) as image:
+        image = image.convert('RGB')
+        width, height = image.size
+        if crop_poster and width > height:
+            poster_width = min(width, round(height * POSTER_ASPECT))
+            image = image.crop((width - poster_width, 0, width, height))
+        image.thumbnail((max_width, max_height), Image.LANCZOS)
+        fd, temp_path = tempfile.mkstemp(dir=str(Path(target).parent), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                image.save(f, 'JPEG', quality=quality, optimize=True)
+            os.replace(temp_path, target)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    return target
+
+
+class CoverProcessor:
+    """封面预处理（需要 Pillow）：在进程池中裁剪、缩放、重新压缩，结果保存在原图旁边供之后复用"""
+    
+    def __init__(self, max_width: int = 600, max_height: int = 900, quality: int = 85,
+                 crop_poster: bool = True, workers: int = 2, store: Optional[CoverStore] = None):
+        self.max_width = max_width
+        self.max_height = max_height
+        self.quality = quality
+        self.crop_poster = crop_poster
+        self.workers = workers
+        self.store = store  # 新生成的文件计入封面存储的容量
+        self._pool = None
+        self._pool_lock = threading.Lock()
+    
+    def target_for(self, source: str) -> Path:
+        """处理结果的文件名包含处理参数，修改配置后会重新生成"""
+        source = Path(source)
+        variant = f"{self.max_width}x{self.max_height}q{self.quality}{'c' if self.crop_poster else ''}"
+        return source.with_name(f"{source.stem}.{variant}.jpg")
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                logger.info(f"启动 {self.workers} 个封面处理进程")
+            return self._pool
+    
+    def process(self, source: str) -> str:
+        """返回处理后的封面路径，处理失败时返回原图"""
+        target = self.target_for(source)
+        if target.exists():
+            os.utime(target)
+            return str(target)
+        try:
+            future = self._get_pool().submit(
+                process_cover_image, str(source), str(target),
+                self.max_width, self.max_height, self.quality, self.crop_poster
+            )
+            future.result()
+        except Exception as e:
+            logger.warning(f"封面处理失败，使用原图: {e}")
+            return str(source)
+        
+        logger.debug(f"封面处理完成: {Path(source).stat().st_size} -> {target.stat().st_size} 字节")
+        if self.store:
+            self.store.register(target)
+        return str(target)
+    
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+class RunState:
+    """运行状态存储（SQLite）
+    
+    - 每个 Plex 库已处理到的 addedAt/updatedAt 高水位
+    - 运行日志：每次运行中每个 ratingKey 的处理状态，用于中断后 --resume 继续和 --retry-failed 重试
+    """
+    
+    # 视为已完成、--resume 时不再处理的状态
+    DONE_STATES = ('applied', 'skipped')
+    # 重试也不会成功的失败原因：不阻止高水位推进，之后的增量运行按 ratingKey 重试
+    PERMANENT_REASONS = ('无法提取番号', '未找到元数据')
+    KEEP_RUNS = 10  # 每个库保留最近几次运行的日志
+    
+    def __init__(self, path: str = "cache/state.db", flush_every: int = 100, flush_interval: float = 5.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_every = flush_every  # 攒够多少条日志提交一次
+        self.flush_interval = flush_interval  # 距上次提交超过多少秒也提交
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=FULL')  # 每次提交都落盘，容器重启不丢已提交的日志
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS watermarks ('
+                'section TEXT PRIMARY KEY, added_at INTEGER NOT NULL, '
+                'updated_at INTEGER NOT NULL, recorded_at REAL NOT NULL)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS runs ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, section TEXT NOT NULL, '
+                'started_at REAL NOT NULL, finished_at REAL)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS journal ('
+                'run_id INTEGER NOT NULL, rating_key INTEGER NOT NULL, state TEXT NOT NULL, '
+                'reason TEXT, updated_at REAL NOT NULL, PRIMARY KEY (run_id, rating_key))'
+            )
+            self._conn.commit()
+    
+    def get_watermark(self, section: str) -> Optional[Tuple[int, int]]:
+        """读取库的高水位 (added_at, updated_at)，从未完整运行过返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT added_at, updated_at FROM watermarks WHERE section = ?', (section,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+    
+    def set_watermark(self, section: str, added_at: int, updated_at: int):
+        """记录高水位，只会向前推进"""
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO watermarks (section, added_at, updated_at, recorded_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(section) DO UPDATE SET '
+                'added_at = MAX(added_at, excluded.added_at), '
+                'updated_at = MAX(updated_at, excluded.updated_at), '
+                'recorded_at = excluded.recorded_at',
+                (section, added_at, updated_at, time.time())
+            )
+            self._conn.commit()
+    
+    def start_run(self, section: str) -> int:
+        """开始新的运行，并清理该库较早运行的日志"""
+        with self._lock:
+            run_id = self._conn.execute(
+                'INSERT INTO runs (section, started_at) VALUES (?, ?)', (section, time.time())
+            ).lastrowid
+            old = [row[0] for row in self._conn.execute(
+                'SELECT id FROM runs WHERE section = ? ORDER BY id DESC LIMIT -1 OFFSET ?',
+                (section, self.KEEP_RUNS)
+            )]
+            if old:
+                marks = ','.join('?' * len(old))
+                self._conn.execute(f'DELETE FROM journal WHERE run_id IN ({marks})', old)
+                self._conn.execute(f'DELETE FROM runs WHERE id IN ({marks})', old)
+            self._conn.commit()
+        return run_id
+    
+    def find_run(self, section: str, unfinished: bool = False) -> Optional[int]:
+        """该库最近一次运行（unfinished=True 时只查找未完成的运行）"""
+        query = 'SELECT id FROM runs WHERE section = ?'
+        if unfinished:
+            query += ' AND finished_at IS NULL'
+        with self._lock:
+            row = self._conn.execute(query + ' ORDER BY id DESC LIMIT 1', (section,)).fetchone()
+        return row[0] if row else None
+    
+    def finish_run(self, run_id: int):
+        self.flush()
+        with self._lock:
+            self._conn.execute('UPDATE runs SET finished_at = ? WHERE id = ?', (time.time(), run_id))
+            self._conn.commit()
+    
+    def record(self, run_id: int, rating_key: int, state: str, reason: Optional[str] = None):
+        """记录视频的处理状态（extracted / scraped / applied / skipped / failed），批量提交"""
+        with self._lock:
+            self._pending.append((run_id, int(rating_key), state, reason, time.time()))
+            due = (len(self._pending) >= self.flush_every or
+                   time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+    
+    def flush(self):
+        """提交缓冲中的日志"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if not pending:
+                return
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO journal (run_id, rating_key, state, reason, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)', pending
+            )
+            self._conn.commit()
+    
+    def run_states(self, run_id: int) -> Dict[int, Tuple[str, Optional[str]]]:
+        """读取某次运行中每个 ratingKey 的最新状态和失败原因"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT rating_key, state, reason FROM journal WHERE run_id = ?', (run_id,)
+            ).fetchall()
+        return {row[0]: (row[1], row[2]) for row in rows}
+    
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    """线程安全的令牌桶限速器，遇到 403/429 时按 AIMD 自适应调整速率"""
+    
+    def __init__(self, rate_limit: float = 1.0, burst: int = 1, max_slowdown: float = 8.0):
+        # rate_limit 为平均请求间隔（秒），<= 0 表示不限速
+        self.base_rate = 1.0 / rate_limit if rate_limit > 0 else None  # 令牌/秒
+        self.rate = self.base_rate
+        self.min_rate = self.base_rate / max_slowdown if self.base_rate else None
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = self._clock()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _clock() -> float:
+        return time.monotonic()
+    
+    @contextmanager
+    def _state(self):
+        """在锁内读写令牌桶状态"""
+        with self._lock:
+            yield
+    
+    @property
+    def interval(self) -> float:
+        """当前平均请求间隔（秒）"""
+        return 1.0 / self.rate if self.rate else 0.0
+    
+    def acquire(self):
+        """获取一个令牌，必要时阻塞等待（预约制，先到先得）"""
+        if not self.base_rate:
+            return
+        with self._state():
+            now = self._clock()
+            self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            logger.debug(f"访问频率限制：等待 {wait:.2f} 秒 (当前间隔:{self.interval:.2f}s)")
+            time.sleep(wait)
+    
+    def wait_time(self) -> float:
+        """距离下一个可用令牌还需等待的秒数（只查看，不消耗令牌）"""
+        if not self.base_rate:
+            return 0.0
+        with self._state():
+            tokens = min(self.burst, self.tokens + max(0.0, self._clock() - self.updated) * self.rate)
+            return max(0.0, (1 - tokens) / self.rate)
+    
+    def on_throttle(self):
+        """被限流（403/429）：速率减半并清空突发额度"""
+        if not self.base_rate:
+            return
+        with self._state():
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+        logger.info(f"🐌 自适应减速: 当前请求间隔 {self.interval:.1f}s")
+    
+    def on_success(self):
+        """请求成功：速率线性恢复，直到配置的上限"""
+        if not self.base_rate:
+            return
+        with self._state():
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.1)
+
+
+class SharedRateLimiter(RateLimiter):
+    """跨进程令牌桶限速器，状态保存在文件中并用 fcntl 加锁
+    
+    同一主机上的多个进程（例如每个 Plex 库一个更新容器）指向同一个状态文件时，
+    共享同一份请求额度和自适应退避状态。
+    """
+    
+    def __init__(self, path: str, rate_limit: float = 1.0, burst: int = 1,
+                 max_slowdown: float = 8.0, name: str = 'javlibrary'):
+        if fcntl is None:
+            raise RuntimeError("共享限速器需要 fcntl 文件锁（仅支持 Linux/macOS）")
+        super().__init__(rate_limit, burst=burst, max_slowdown=max_slowdown)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.name = name  # 状态文件中的键，不同站点使用不同的额度
+    
+    @staticmethod
+    def _clock() -> float:
+        # 跨进程需要使用统一的墙上时间
+        return time.time()
+    
+    @contextmanager
+    def _state(self):
+        """加文件锁读取共享状态，退出时写回"""
+        with self._lock, open(self.path, 'a+', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    states = json.loads(f.read() or '{}')
+                except ValueError:
+                    logger.warning(f"限速状态文件损坏，已重置: {self.path}")
+                    states = {}
+                
+                state = states.get(self.name)
+                if state:
+                    self.tokens = min(float(state['tokens']), self.burst)
+                    self.updated = state['updated']
+                    # 速率限制在本进程配置的范围内
+                    self.rate = min(max(state['rate'], self.min_rate), self.base_rate)
+                
+                yield
+                
+                states[self.name] = {'tokens': self.tokens, 'updated': self.updated, 'rate': self.rate}
+                f.seek(0)
+                f.truncate()
+                json.dump(states, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Mirror:
+    """JavLibrary 镜像站：独立的请求额度和健康度
+    
+    健康度在 0~1 之间，被拒绝（403/429）、服务器错误（5xx）或请求出错时减半并进入冷却，成功后逐步恢复。
+    """
+    
+    MAX_COOLDOWN = 300.0  # 最长冷却时间（秒）
+    
+    def __init__(self, base_url: str, limiter: RateLimiter):
+        self.base_url = base_url.rstrip('/')
+        self.host = urlparse(self.base_url).netloc or self.base_url
+        self.limiter = limiter
+        self.health = 1.0
+        self.failures = 0  # 连续失败次数
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+    
+    @property
+    def cooling(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+    
+    def cost(self) -> float:
+        """选择镜像的代价：等待令牌的时间，加上按健康度折算的惩罚"""
+        return self.limiter.wait_time() + (1.0 - self.health) * max(self.limiter.interval, 1.0) * 4
+    
+    def on_success(self):
+        with self._lock:
+            self.health = min(1.0, self.health + 0.1)
+            self.failures = 0
+    
+    def on_failure(self, cooldown: float):
+        """被拒绝或请求出错：健康度减半，冷却时间随连续失败次数翻倍"""
+        with self._lock:
+            self.health /= 2
+            self.failures += 1
+            cooldown = min(self.MAX_COOLDOWN, cooldown * 2 ** (self.failures - 1))
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+        logger.info(f"🪞 镜像 {self.host} 暂停 {cooldown:.1f} 秒 (健康度 {self.health:.2f})")
+
+
+class CloudflareSessionPool:
+    """cloudscraper 会话池
+    
+    工作线程借出会话发送请求，某个会话被 CloudFlare 拒绝（403）时丢弃并换入新会话，不影响其他线程；
+    通过验证后得到的 cookie（cf_clearance 等）与 User-Agent 一起保存到磁盘，下次启动时直接复用，直到过期。
+    """
+    
+    CLEARANCE_COOKIE = 'cf_clearance'  # 通过 CloudFlare 验证的凭据，只有它变化时才需要保存
+    
+    def __init__(self, size: int = 2, state_path: Optional[str] = None, proxy: Optional[str] = None,
+                 user_agent: str = '', cookies: Optional[str] = None):
+        self.size = max(1, size)
+        self.state_path = Path(state_path) if state_path else None
+        self.proxy = proxy
+        self.user_agent = user_agent  # cf_clearance 与 User-Agent 绑定，User-Agent 变化后保存的 cookie 失效
+        self.cookies = cookies or ''  # 配置文件中从浏览器复制的 Cookie
+        self._lock = threading.Lock()
+        self._saved = self._load_state()  # 上次保存的 cookie 列表
+        self._idle = queue.Queue()
+        for _ in range(self.size):
+            self._idle.put(self._create())
+        if self._saved:
+            logger.info(f"复用已保存的 CloudFlare 会话 ({len(self._saved)} 个 cookie)")
+    
+    def _fingerprint(self) -> str:
+        """保存的会话只在 User-Agent 和配置的 Cookie 都未变化时有效"""
+        return hashlib.sha1(f"{self.user_agent}\n{self.cookies}".encode('utf-8')).hexdigest()
+    
+    def _load_state(self) -> List[Dict]:
+        if not self.state_path or not self.state_path.exists():
+            return []
+        try:
+            state = json.loads(self.state_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取 CloudFlare 会话失败: {e}")
+            return []
+        if state.get('fingerprint') != self._fingerprint():
+            logger.info("User-Agent 或 Cookie 配置已变化，不再使用保存的 CloudFlare 会话")
+            return []
+        now = time.time()
+        return [cookie for cookie in state.get('cookies', [])
+                if not cookie.get('expires') or cookie['expires'] > now]
+    
+    def _create(self):
+        """创建新会话：先设置配置的 Cookie，再加载保存的（更新的）cookie"""
+        session = cloudscraper.create_scraper()
+        if self.proxy:
+            session.proxies = {'http': self.proxy, 'https': self.proxy}
+        for item in self.cookies.split('; '):
+            if '=' in item:
+                key, value = item.split('=', 1)
+                session.cookies.set(key, value)
+        with self._lock:
+            saved = list(self._saved)
+        for cookie in saved:
+            session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''),
+                                path=cookie.get('path', '/'), expires=cookie.get('expires'))
+        return session
+    
+    def checkout(self):
+        """借出一个会话（全部被占用时等待）"""
+        return self._idle.get()
+    
+    def checkin(self, session):
+        self._idle.put(session)
+    
+    def renew(self, session):
+        """会话被拒绝时丢弃；它的 cf_clearance 与保存的相同时，保存的该站点 cookie 也一并作废。返回新会话"""
+        rejected = self._clearance(self._cookie_list(session))
+        with self._lock:
+            stale = {domain for domain, value in rejected if (domain, value) in self._clearance(self._saved)}
+            if stale:
+                self._saved = [cookie for cookie in self._saved if cookie.get('domain', '') not in stale]
+                self._write_state()
+                logger.info("保存的 CloudFlare 会话已失效")
+        session.close()
+        logger.info("🔄 更换 CloudFlare 会话")
+        return self._create()
+    
+    @staticmethod
+    def _cookie_list(session) -> List[Dict]:
+        return [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain,
+                 'path': cookie.path, 'expires': cookie.expires} for cookie in session.cookies]
+    
+    @classmethod
+    def _clearance(cls, cookies: List[Dict]) -> set:
+        """cookie 列表中的 CloudFlare 验证结果 {(域名, 值)}"""
+        return {(cookie.get('domain', ''), cookie['value']) for cookie in cookies
+                if cookie['name'] == cls.CLEARANCE_COOKIE}
+    
+    def remember(self, session):
+        """请求成功后保存会话 cookie；只有 cf_clearance 变化时才更新并写入磁盘
+        
+        __cf_bm 等 cookie 每次响应都可能变化，不值得每个请求都写一次文件
+        """
+        cookies = self._cookie_list(session)
+        with self._lock:
+            merged = {(cookie['name'], cookie.get('domain', ''), cookie.get('path', '/')): cookie
+                      for cookie in self._saved}
+            merged.update({(cookie['name'], cookie.get('domain', ''), cookie.get('path', '/')): cookie
+                           for cookie in cookies})
+            merged = list(merged.values())
+            if self._clearance(merged) == self._clearance(self._saved):
+                return
+            self._saved = merged
+            self._write_state()
+        logger.debug(f"已保存 CloudFlare 会话: {self.state_path}")
+    
+    def _write_state(self):
+        """把 self._saved 原子写入状态文件（调用方持有锁），为空时删除文件"""
+        if not self.state_path:
+            return
+        if not self._saved:
+            self.state_path.unlink(missing_ok=True)
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=str(self.state_path.parent), suffix='.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self._fingerprint(), 'saved_at': time.time(),
+                       'cookies': self._saved}, f, ensure_ascii=False)
+        os.replace(temp_path, self.state_path)
+    
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
 class JavLibraryScraper:
     """JavLibrary 爬虫类"""
     
-    def __init__(self, base_url: str = "https://www.javlibrary.com", 
+    def __init__(self, base_url: Union[str, List[str]] = "https://www.javlibrary.com", 
                  proxy: Optional[str] = None, 
                  timeout: int = 10,
                  language: str = "cn",
                  cookies: Optional[str] = None,
                  user_agent: Optional[str] = None,
                  rate_limit: float = 1.0,
-                 max_retries: int = 3):
-        self.base_url = base_url.rstrip('/')
+                 max_retries: int = 3,
+                 cache: Optional[MetadataCache] = None,
+                 burst: int = 1,
+                 limiter: Optional[RateLimiter] = None,
+                 limiter_factory: Optional[Callable[[str], RateLimiter]] = None,
+                 parser_backend: str = 'auto',
+                 parse_workers: int = 0,
+                 session_pool_size: int = 2,
+                 session_file: Optional[str] = None):
+        base_urls = [base_url] if isinstance(base_url, str) else list(base_url)
+        if not base_urls:
+            raise ValueError("至少需要配置一个 JavLibrary 网址")
         self.timeout = timeout
         self.language = language  # cn, en, ja
         self.rate_limit = rate_limit  # 请求间隔（秒）
         self.max_retries = max_retries  # 最大重试次数
-        self.last_request_time = 0  # 上次请求时间
-        self.consecutive_429_count = 0  # 连续429错误计数
-        self.adaptive_delay = 0  # 自适应延迟
-        self.scraper = cloudscraper.create_scraper()
-        
-        if proxy:
-            self.scraper.proxies = {
-                'http': proxy,
-                'https': proxy
-            }
+        # 每个镜像站使用独立的限速器；limiter_factory 按主机名创建（例如跨进程共享限速），
+        # 只有一个网址时可直接传入 limiter
+        factory = limiter_factory or (lambda host: RateLimiter(rate_limit, burst=burst))
+        self.mirrors = []
+        for index, url in enumerate(base_urls):
+            host = urlparse(url).netloc or url
+            mirror_limiter = limiter if (limiter and index == 0) else factory(host)
+            self.mirrors.append(Mirror(url, mirror_limiter))
+        # 链接统一用第一个网址拼接，发送请求时再替换为选中的镜像
+        self.base_url = self.mirrors[0].base_url
+        self.limiter = self.mirrors[0].limiter
+        self.cache = cache  # 本地元数据缓存（可选）
+        self.parser_backend = resolve_parser_backend(parser_backend)  # 详情页解析后端
+        self.parse_workers = parse_workers  # 解析进程数，0 表示在当前线程解析
+        self._parse_pool = None
+        self._parse_pool_lock = threading.Lock()
+        # 同一番号的并发请求合并：番号 -> Future；expect() 登记的重复番号在全部取走前保留结果
+        self._inflight = {}
+        self._expected = {}
+        self._inflight_lock = threading.Lock()
+        self._local = threading.local()  # 当前线程最近一次获取详情页时响应的 ETag/Last-Modified
+        self._missing = set()  # 本次运行中确认站点上没有的番号（区别于请求失败）
         
         # 设置 User-Agent
         if user_agent:
@@ -132,93 +1170,273 @@ class JavLibraryScraper:
             'Upgrade-Insecure-Requests': '1',
         }
         
-        # 处理 Cookie
-        if cookies:
-            self.headers['Cookie'] = cookies
-            # 同时设置到 scraper 的 cookies
-            self._parse_cookies(cookies)
+        # 会话池：配置的 Cookie 设置到每个会话的 cookie 中（不再写入请求头，
+        # 否则会覆盖 CloudFlare 验证后更新的 cookie）
+        self.sessions = CloudflareSessionPool(
+            size=session_pool_size,
+            state_path=session_file,
+            proxy=proxy,
+            user_agent=self.user_agent,
+            cookies=cookies
+        )
     
-    def _parse_cookies(self, cookie_string: str):
-        """解析 Cookie 字符串并设置到 scraper"""
-        cookies = {}
-        for item in cookie_string.split('; '):
-            if '=' in item:
-                key, value = item.split('=', 1)
-                cookies[key] = value
-        
-        for key, value in cookies.items():
-            self.scraper.cookies.set(key, value)
+    def _pick_mirror(self) -> Mirror:
+        """选择未在冷却中、等待时间和健康度综合最优的镜像；全部冷却时选最早恢复的"""
+        ready = [mirror for mirror in self.mirrors if not mirror.cooling]
+        if ready:
+            return min(ready, key=lambda mirror: mirror.cost())
+        return min(self.mirrors, key=lambda mirror: mirror.cooldown_until)
+    
+    def _mirror_url(self, mirror: Mirror, url: str) -> str:
+        """把以第一个网址开头的链接替换为指定镜像的地址"""
+        if mirror.base_url != self.base_url and url.startswith(self.base_url):
+            return mirror.base_url + url[len(self.base_url):]
+        return url
+    
+    def _backoff(self, wait_time: float):
+        """还有可用的镜像时立即切换，全部冷却中才等待"""
+        if any(not mirror.cooling for mirror in self.mirrors):
+            return
+        logger.info(f"等待 {wait_time:.2f} 秒后重试")
+        time.sleep(wait_time)
     
     def _rate_limited_request(self, method: str, url: str, **kwargs):
-        """带有频率限制和重试机制的请求"""
-        # 确保请求间隔（包含自适应延迟）
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        total_delay = self.rate_limit + self.adaptive_delay
-        
-        if time_since_last < total_delay:
-            sleep_time = total_delay - time_since_last
-            logger.debug(f"访问频率限制：等待 {sleep_time:.2f} 秒 (基础:{self.rate_limit}s + 自适应:{self.adaptive_delay}s)")
-            time.sleep(sleep_time)
-        
-        # 重试机制
-        for attempt in range(self.max_retries):
+        """带有频率限制和重试机制的请求，失败时切换到其他镜像重试"""
+        # 重试机制：每多一个镜像多一次尝试机会
+        attempts = self.max_retries + len(self.mirrors) - 1
+        for attempt in range(attempts):
+            mirror = self._pick_mirror()
+            # 每次尝试都需要从该镜像的限速器获取令牌；拿到令牌后才借出会话，
+            # 等待令牌时不占用会话，其他线程可以用它请求别的镜像
+            mirror.limiter.acquire()
+            session = self.sessions.checkout()
             try:
-                self.last_request_time = time.time()
-                response = getattr(self.scraper, method.lower())(url, **kwargs)
+                response = getattr(session, method.lower())(self._mirror_url(mirror, url), **kwargs)
                 
                 # 检查响应状态
                 if response.status_code == 403:
-                    logger.warning(f"访问被拒绝 (403)，尝试 {attempt + 1}/{self.max_retries}")
-                    if attempt < self.max_retries - 1:
+                    logger.warning(f"访问被拒绝 (403) [{mirror.host}]，尝试 {attempt + 1}/{attempts}")
+                    mirror.limiter.on_throttle()
+                    # 换入新会话，下次请求重新通过 CloudFlare 验证
+                    session = self.sessions.renew(session)
+                    if attempt < attempts - 1:
                         # 指数退避
                         wait_time = (2 ** attempt) * self.rate_limit
-                        logger.info(f"等待 {wait_time:.2f} 秒后重试")
-                        time.sleep(wait_time)
+                        mirror.on_failure(wait_time)
+                        self._backoff(wait_time)
                         continue
                 elif response.status_code == 429:
-                    self.consecutive_429_count += 1
-                    logger.warning(f"请求频率过快 (429)，尝试 {attempt + 1}/{self.max_retries}，连续429次数: {self.consecutive_429_count}")
-                    
-                    # 自适应调整：如果连续遇到429，增加基础延迟
-                    if self.consecutive_429_count >= 3:
-                        self.adaptive_delay = min(self.adaptive_delay + 1.0, 5.0)  # 最多增加5秒
-                        logger.info(f"🐌 自适应减速: 增加 {self.adaptive_delay:.1f}s 延迟")
+                    logger.warning(f"请求频率过快 (429) [{mirror.host}]，尝试 {attempt + 1}/{attempts}")
+                    mirror.limiter.on_throttle()
                     
-                    if attempt < self.max_retries - 1:
+                    if attempt < attempts - 1:
                         # 429错误使用渐进式退避：5秒 -> 15秒 -> 30秒
                         wait_times = [5.0, 15.0, 30.0]
                         wait_time = wait_times[min(attempt, len(wait_times)-1)]
-                        logger.info(f"等待 {wait_time:.2f} 秒后重试")
-                        time.sleep(wait_time)
+                        mirror.on_failure(wait_time)
+                        self._backoff(wait_time)
+                        continue
+                elif response.status_code >= 500:
+                    # 镜像或其源站故障（502/503/52x），与请求出错一样换镜像重试
+                    logger.warning(f"服务器错误 ({response.status_code}) [{mirror.host}]，尝试 {attempt + 1}/{attempts}")
+                    if attempt < attempts - 1:
+                        wait_time = (2 ** attempt) * self.rate_limit
+                        mirror.on_failure(wait_time)
+                        self._backoff(wait_time)
                         continue
                 
-                # 成功请求，重置429计数器
-                if response.status_code == 200:
-                    if self.consecutive_429_count > 0:
-                        logger.debug(f"✅ 请求成功，重置429计数器")
-                    self.consecutive_429_count = 0
-                    # 逐渐减少自适应延迟
-                    if self.adaptive_delay > 0:
-                        self.adaptive_delay = max(0, self.adaptive_delay - 0.5)
+                # 成功请求（包括 304 未修改），逐渐恢复请求速率，并保存通过验证的会话
+                if response.status_code in (200, 304):
+                    mirror.limiter.on_success()
+                    mirror.on_success()
+                    self.sessions.remember(session)
                 
                 return response
                 
             except Exception as e:
-                logger.warning(f"请求失败 (尝试 {attempt + 1}/{self.max_retries}): {e}")
-                if attempt < self.max_retries - 1:
+                logger.warning(f"请求失败 [{mirror.host}] (尝试 {attempt + 1}/{attempts}): {e}")
+                if attempt < attempts - 1:
                     wait_time = (2 ** attempt) * self.rate_limit
-                    time.sleep(wait_time)
+                    mirror.on_failure(wait_time)
+                    self._backoff(wait_time)
                 else:
                     raise
+            finally:
+                self.sessions.checkin(session)
         
         return None
     
+    def expect(self, codes) -> Dict[str, int]:
+        """登记本次运行将要查询的番号，同一番号对应多个文件（CD1/CD2、重复文件）时
+        只爬取一次，结果保留到所有文件都取走为止。返回重复番号及其文件数"""
+        duplicates = {code: count for code, count in
+                      Counter(MetadataCache.normalize_code(code) for code in codes if code).items() if count > 1}
+        with self._inflight_lock:
+            for code, count in duplicates.items():
+                self._expected[code] = self._expected.get(code, 0) + count
+        return duplicates
+    
+    def clear_expected(self):
+        """运行结束时丢弃未被取走的共享结果（例如被跳过处理的文件）"""
+        with self._inflight_lock:
+            self._expected.clear()
+            for code in [code for code, future in self._inflight.items() if future.done()]:
+                del self._inflight[code]
+    
     def search_by_code(self, code: str) -> Optional[Dict]:
-        """根据番号搜索影片信息"""
+        """根据番号搜索影片信息，同一番号的并发查询只发出一次请求并共享结果"""
+        key = MetadataCache.normalize_code(code)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            remaining = self._expected.get(key, 1) - 1
+            if remaining > 0:
+                self._expected[key] = remaining
+            else:
+                self._expected.pop(key, None)
+        
+        if owner:
+            try:
+                future.set_result(self._lookup(code))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            logger.debug(f"复用同一番号的查询结果: {code}")
+        
+        try:
+            return future.result()
+        finally:
+            # 没有其他文件等待该番号时释放结果
+            with self._inflight_lock:
+                if key not in self._expected and self._inflight.get(key) is future and future.done():
+                    del self._inflight[key]
+    
+    def confirmed_missing(self, code: str) -> bool:
+        """番号是否已确认在站点上不存在（搜索结果中没有，而不是请求失败）"""
+        return MetadataCache.normalize_code(code) in self._missing
+    
+    def _lookup(self, code: str) -> Optional[Dict]:
+        """查询单个番号（优先读取本地缓存，过期的缓存先向详情页确认是否有变化）"""
+        self._local.validators = (None, None)
+        metadata = None
+        if self.cache:
+            entry = self.cache.get_entry(code, self.language)
+            if entry and not self.cache.is_stale(entry):
+                logger.debug(f"命中缓存: {code}")
+                return entry.metadata
+            video_id = self.cache.get_detail_id(code, self.language) if entry else None
+            if video_id and (entry.etag or entry.last_modified):
+                metadata, received = self._revalidate(code, entry, video_id)
+                if metadata is entry.metadata:
+                    return metadata
+                if not received:
+                    # 被拒绝、超时等请求失败不能说明页面有变化，使用过期的缓存，也不再额外发起搜索
+                    logger.info(f"确认缓存失败，使用过期的缓存: {code}")
+                    return entry.metadata
+                if not metadata:
+                    logger.info(f"详情页已失效，重新搜索: {code}")
+                    self.cache.delete_detail_id(code, self.language)
+            if not metadata and self.cache.is_known_miss(code, self.language):
+                logger.info(f"⏭️ 缓存记录为未找到，跳过: {code}")
+                self._missing.add(MetadataCache.normalize_code(code))
+                return None
+        
+        if not metadata:
+            metadata = self._search_remote(code)
+        if self.cache and metadata and any([metadata['title'], metadata['genres'], metadata['actors']]):
+            etag, last_modified = self._local.validators
+            self.cache.put(code, self.language, metadata, etag=etag, last_modified=last_modified)
+        return metadata
+    
+    def _revalidate(self, code: str, entry: CacheEntry, video_id: str) -> Tuple[Optional[Dict], bool]:
+        """用保存的 ETag/Last-Modified 条件请求详情页，返回 (元数据, 是否取回了页面)
+        
+        304 时只延长缓存有效期并返回缓存的元数据（不解析页面）；页面有变化时返回重新解析的结果；
+        404 或页面解析不出内容时为 (None, True)；重试用尽的 403/429、超时、解析出错时为 (None, False)。
+        """
+        headers = dict(self.headers)
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        try:
+            response = self._rate_limited_request('get', self._detail_url(video_id),
+                                                  headers=headers, timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"确认缓存是否过期失败 {code}: {e}")
+            return None, False
+        # Response 在 4xx/5xx 时为假值，这里要区分"没有响应"和 404
+        if response is None or response.status_code not in (200, 304, 404):
+            return None, False
+        if response.status_code == 304:
+            logger.debug(f"详情页未变化，延长缓存: {code}")
+            self.cache.touch(code, self.language)
+            return entry.metadata, True
+        if response.status_code == 404:
+            return None, True
+        
+        logger.debug(f"详情页已更新，重新解析: {code}")
+        self._remember_validators(response)
+        try:
+            metadata = self._parse_html(response.text, code)
+        except Exception as e:
+            logger.error(f"解析详情页 {code} 失败: {e}")
+            return None, False
+        if metadata and any([metadata['title'], metadata['genres'], metadata['actors']]):
+            return metadata, True
+        return None, True
+    
+    def _remember_validators(self, response):
+        """记录详情页响应的验证器，写入缓存时一起保存"""
+        self._local.validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    
+    @property
+    def lang_path(self) -> str:
+        """根据语言设置构建URL路径前缀"""
+        return f"/{self.language}" if self.language != "en" else ""
+    
+    def _detail_url(self, video_id: str) -> str:
+        """根据详情页 ID 构建详情页URL"""
+        return f"{self.base_url}{self.lang_path}/?v={video_id}"
+    
+    @staticmethod
+    def _extract_video_id(url: str) -> Optional[str]:
+        """从URL中提取详情页 ID（?v= 参数）"""
+        match = re.search(r'[?&]v=([^&#]+)', url)
+        return match.group(1) if match else None
+    
+    def _index_video_links(self, soup: BeautifulSoup) -> Dict[str, str]:
+        """从搜索结果/列表页中收集 番号 -> 详情页 ID 映射并写入索引"""
+        entries = {}
+        for link in soup.find_all('a', href=re.compile(r'\?v=')):
+            id_elem = link.find('div', class_='id')
+            video_id = self._extract_video_id(link['href'])
+            if id_elem and video_id:
+                entries[id_elem.text.strip().upper()] = video_id
+        if self.cache and entries:
+            self.cache.put_detail_ids(entries, self.language)
+        return entries
+    
+    def _search_remote(self, code: str) -> Optional[Dict]:
+        """在 JavLibrary 上搜索番号"""
+        # 已知详情页地址时直接请求详情页，跳过搜索
+        if self.cache:
+            video_id = self.cache.get_detail_id(code, self.language)
+            if video_id:
+                logger.debug(f"命中详情页索引: {code} -> {video_id}")
+                metadata, received = self._fetch_detail_page(self._detail_url(video_id), code)
+                if metadata and any([metadata['title'], metadata['genres'], metadata['actors']]):
+                    return metadata
+                if not received:
+                    # 被拒绝、超时等请求失败不能说明索引失效，保留索引，也不再额外发起搜索
+                    return None
+                logger.info(f"详情页索引失效，重新搜索: {code}")
+                self.cache.delete_detail_id(code, self.language)
+        
         try:
-            # 根据语言设置构建URL
-            lang_path = f"/{self.language}" if self.language != "en" else ""
+            lang_path = self.lang_path
             search_url = f"{self.base_url}{lang_path}/vl_searchbyid.php"
             params = {'keyword': code}
             
@@ -234,17 +1452,24 @@ class JavLibraryScraper:
                 logger.warning(f"搜索 {code} 失败: HTTP {response.status_code if response else 'None'}")
                 return None
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
             # 调试：记录响应状态和URL
             logger.debug(f"响应状态: {response.status_code}, URL: {response.url}")
             logger.debug(f"Content-Type: {response.headers.get('Content-Type', 'N/A')}")
             
             # 检查是否直接跳转到详情页
             if 'vl_searchbyid.php' not in response.url:
-                return self._parse_detail_page(soup, code)
+                video_id = self._extract_video_id(response.url)
+                if self.cache and video_id:
+                    self.cache.put_detail_ids({code: video_id}, self.language)
+                self._remember_validators(response)
+                return self._parse_html(response.text, code)
+            
+            soup = BeautifulSoup(response.text, 'html.parser')
+            
+            # 搜索结果页：记录页面上所有番号的详情页地址
+            self._index_video_links(soup)
             
-            # 搜索结果页，找到第一个匹配的链接
+            # 找到第一个匹配的链接
             video_links = soup.find_all('a', href=re.compile(r'\?v='))
             for link in video_links:
                 if code.upper() in link.text.upper():
@@ -252,25 +1477,167 @@ class JavLibraryScraper:
                     return self._fetch_detail(detail_url, code)
             
             logger.warning(f"未找到番号 {code} 的信息")
+            self._missing.add(MetadataCache.normalize_code(code))
+            if self.cache:
+                self.cache.put_miss(code, self.language)
             return None
             
         except Exception as e:
             logger.error(f"搜索 {code} 时出错: {e}")
             return None
     
+    def prefetch(self, codes: List[str], min_group: int = 3, max_pages: int = 20) -> int:
+        """按系列批量遍历列表页，预先填充 番号 -> 详情页 索引
+        
+        列表页一次列出数十个番号，但不包含类别/演员等详细信息，
+        所以预取只填充详情页索引，之后每个番号只需一次详情页请求。
+        返回通过预取解析到的番号数量。
+        """
+        if not self.cache:
+            logger.warning("未启用缓存，跳过预取")
+            return 0
+        
+        # 只预取既没有缓存也没有索引的番号
+        groups: Dict[str, set] = {}
+        for code in set(MetadataCache.normalize_code(c) for c in codes):
+            if (self.cache.get(code, self.language) or
+                    self.cache.get_detail_id(code, self.language) or
+                    self.cache.is_known_miss(code, self.language)):
+                continue
+            groups.setdefault(MetadataCache.code_prefix(code), set()).add(code)
+        
+        resolved = 0
+        for prefix, pending in sorted(groups.items(), key=lambda item: -len(item[1])):
+            if len(pending) < min_group:
+                continue
+            
+            # 已知发行商/制作商时遍历其列表页，否则按前缀搜索
+            listing_page = self.cache.get_listing_page(prefix, self.language)
+            if listing_page:
+                url = f"{self.base_url}{self.lang_path}/{listing_page}"
+                params = {}
+            else:
+                url = f"{self.base_url}{self.lang_path}/vl_searchbyid.php"
+                params = {'keyword': prefix}
+            
+            group_size = len(pending)
+            # 翻页数不超过待解析数量，保证预取请求数不多于逐个搜索
+            for page in range(1, min(max_pages, group_size) + 1):
+                try:
+                    response = self._rate_limited_request(
+                        'get', url, params={**params, 'page': page},
+                        headers=self.headers, timeout=self.timeout
+                    )
+                except Exception as e:
+                    logger.warning(f"预取 {prefix} 第 {page} 页失败: {e}")
+                    break
+                if not response or response.status_code != 200:
+                    break
+                
+                soup = BeautifulSoup(response.text, 'html.parser')
+                entries = self._index_video_links(soup)
+                pending -= set(entries)
+                if not entries or not pending or not soup.select_one('a.next'):
+                    break
+            
+            resolved += group_size - len(pending)
+            logger.info(f"📚 预取 {prefix}: 解析 {group_size - len(pending)}/{group_size} 个番号")
+        
+        return resolved
+    
     def _fetch_detail(self, url: str, code: str) -> Optional[Dict]:
         """获取详情页信息"""
+        return self._fetch_detail_page(url, code)[0]
+    
+    def _fetch_detail_page(self, url: str, code: str) -> Tuple[Optional[Dict], bool]:
+        """获取详情页信息，返回 (元数据, 是否取回了页面)
+        
+        只有站点返回了页面（200/404）才算取回；重试用尽的 403/429、超时、解析出错时为 False
+        """
         try:
             response = self._rate_limited_request('get', url, headers=self.headers, timeout=self.timeout)
-            if not response or response.status_code != 200:
-                return None
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            return self._parse_detail_page(soup, code)
-            
         except Exception as e:
             logger.error(f"获取详情页 {url} 失败: {e}")
-            return None
+            return None, False
+        # Response 在 4xx/5xx 时为假值，这里要区分"没有响应"和 404
+        if response is None or response.status_code not in (200, 404):
+            return None, False
+        if response.status_code == 404:
+            return None, True
+        
+        self._remember_validators(response)
+        try:
+            return self._parse_html(response.text, code), True
+        except Exception as e:
+            logger.error(f"解析详情页 {url} 失败: {e}")
+            return None, False
+    
+    def _get_parse_pool(self, workers: int) -> ProcessPoolExecutor:
+        """创建（或复用）解析进程池"""
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(max_workers=workers)
+                logger.info(f"启动 {workers} 个解析进程")
+            return self._parse_pool
+    
+    def _discard_parse_pool(self, pool: ProcessPoolExecutor):
+        """丢弃已损坏的进程池（例如子进程被 OOM 杀掉），下次解析时重新创建"""
+        with self._parse_pool_lock:
+            if self._parse_pool is pool:
+                self._parse_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _parse_html(self, html: str, code: str) -> Dict:
+        """解析详情页：先用解析后端只处理元数据子树，失败时退回完整页面解析"""
+        if self.cache and self.cache.store_html:
+            self.cache.put_page(code, self.language, html)
+        
+        if self.parse_workers > 0:
+            # 交给解析进程，只传回普通 dict，避免线程在 GIL 上串行
+            pool = self._get_parse_pool(self.parse_workers)
+            try:
+                metadata = pool.submit(parse_detail_html, html, code, self.base_url, self.parser_backend).result()
+            except BrokenProcessPool:
+                logger.warning(f"解析进程异常退出，重建进程池，{code} 改在当前线程解析")
+                self._discard_parse_pool(pool)
+                metadata = parse_detail_html(html, code, self.base_url, self.parser_backend)
+        else:
+            metadata = parse_detail_html(html, code, self.base_url, self.parser_backend)
+        
+        if metadata is None:
+            logger.debug(f"子树解析未找到信息，使用完整页面解析: {code}")
+            metadata = self._parse_detail_page(BeautifulSoup(html, 'html.parser'), code)
+        return metadata
+    
+    def reparse_cached_pages(self) -> int:
+        """用解析进程池重新解析缓存中保存的详情页并更新元数据缓存，返回解析的页面数"""
+        if not self.cache:
+            logger.warning("未启用缓存，无法重新解析")
+            return 0
+        
+        pool = self._get_parse_pool(self.parse_workers or os.cpu_count() or 1)
+        count = 0
+        for batch in self.cache.iter_pages(self.language):
+            codes = [code for code, _, _ in batch]
+            htmls = [html for _, html, _ in batch]
+            results = pool.map(parse_detail_html, htmls, codes,
+                               repeat(self.base_url), repeat(self.parser_backend), chunksize=16)
+            for (code, html, fetched_at), metadata in zip(batch, results):
+                if metadata is None:
+                    metadata = self._parse_detail_page(BeautifulSoup(html, 'html.parser'), code)
+                if any([metadata['title'], metadata['genres'], metadata['actors']]):
+                    self.cache.put(code, self.language, metadata, fetched_at=fetched_at)
+                count += 1
+            logger.info(f"已重新解析 {count} 个详情页")
+        return count
+    
+    def close(self):
+        """关闭解析进程池和会话池"""
+        with self._parse_pool_lock:
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown()
+                self._parse_pool = None
+        self.sessions.close()
     
     def _parse_detail_page(self, soup: BeautifulSoup, code: str) -> Dict:
         """解析详情页"""
@@ -283,7 +1650,9 @@ class JavLibraryScraper:
             'director': '',
             'release_date': '',
             'rating': 0,
-            'cover_url': ''
+            'cover_url': '',
+            'maker_page': '',
+            'label_page': ''
         }
         
         try:
@@ -368,6 +1737,12 @@ class JavLibraryScraper:
                     logger.debug(f"找到制作商: {metadata['studio']}")
                     break
             
+            # 制作商/发行商列表页（用于批量预取）
+            for key, pattern in (('maker_page', 'vl_maker.php'), ('label_page', 'vl_label.php')):
+                listing_elem = soup.select_one(f'a[href*="{pattern}"]')
+                if listing_elem:
+                    metadata[key] = listing_elem['href'].lstrip('./')
+            
             # 发行商（备选）
             if not metadata['studio']:
                 label_selectors = [
@@ -438,16 +1813,140 @@ class JavLibraryScraper:
         return metadata
 
 
+# 库中视频的精简记录：只保留判断和处理所需的字段，需要编辑时再获取完整对象
+# 跳过判断只依赖列表接口一次性返回的字段，不会触发 plexapi 对单个条目的懒加载
+VideoRecord = namedtuple('VideoRecord', [
+    'rating_key', 'title', 'file', 'studio',
+    'genre_count', 'role_count', 'collection_count',
+    'main_actor', 'added_at', 'updated_at', 'has_poster',
+])
+
+
+class PlexEditBuilder:
+    """收集一个视频的全部字段和标签修改，最终合并为一次 PUT 请求
+    
+    Plex 单条目编辑时提交的标签列表会替换原有标签，因此添加标签时先合并视频当前的标签，
+    同一类标签多次添加也会累积在一起（不会像多次调用 addLabel 那样互相覆盖）。
+    提交前与视频当前状态比较，只发送有变化的字段和标签，没有变化时不发送请求。
+    """
+    
+    # 顺序有意义的标签（第一个演员是主演），其他标签只比较集合
+    ORDERED_TAGS = {'actor'}
+    
+    def __init__(self, video):
+        self.video = video
+        self.fields = {}  # 字段名 -> 新值
+        self.tags = {}  # 标签类型（单数，如 genre）-> 完整的目标标签列表
+    
+    def current_tags(self, tag: str) -> List[str]:
+        """视频当前的某类标签"""
+        return [item.tag for item in getattr(self.video, EditTagsMixin._tagPlural(tag), None) or []]
+    
+    def set_field(self, field: str, value) -> 'PlexEditBuilder':
+        self.fields[field] = value
+        return self
+    
+    def _field_changed(self, field: str) -> bool:
+        current, value = getattr(self.video, field, None), self.fields[field]
+        if isinstance(value, float):
+            return current is None or round(float(current), 1) != round(value, 1)
+        return (current or '') != (value or '')
+    
+    def _tags_changed(self, tag: str) -> bool:
+        current, values = self.current_tags(tag), self.tags[tag]
+        if tag in self.ORDERED_TAGS:
+            return current != values
+        return set(current) != set(values)
+    
+    def changes(self) -> Dict[str, Tuple]:
+        """与视频当前状态不同的字段和标签：名称 -> (当前值, 新值)"""
+        changes = {}
+        for field in self.fields:
+            if self._field_changed(field):
+                changes[field] = (getattr(self.video, field, None), self.fields[field])
+        for tag in self.tags:
+            if self._tags_changed(tag):
+                changes[tag] = (self.current_tags(tag), self.tags[tag])
+        return changes
+    
+    @staticmethod
+    def describe(changes: Dict[str, Tuple]) -> str:
+        """将修改内容格式化为一行日志"""
+        parts = []
+        for name, (old, new) in changes.items():
+            if isinstance(new, list) and name not in PlexEditBuilder.ORDERED_TAGS:
+                added = [f"+{value}" for value in new if value not in old]
+                removed = [f"-{value}" for value in old if value not in new]
+                parts.append(f"{name}: {' '.join(added + removed)}")
+            elif isinstance(new, list):
+                parts.append(f"{name}: {', '.join(old) or '(空)'} → {', '.join(new)}")
+            else:
+                parts.append(f"{name}: {old or '(空)'} → {new}")
+        return '; '.join(parts)
+    
+    def add_tags(self, tag: str, values: List[str]) -> 'PlexEditBuilder':
+        """在当前标签基础上追加（去重并保持顺序）"""
+        merged = self.tags.get(tag)
+        if merged is None:
+            merged = self.current_tags(tag)
+        self.tags[tag] = list(dict.fromkeys(merged + [value for value in values if value]))
+        return self
+    
+    def set_tags(self, tag: str, values: List[str]) -> 'PlexEditBuilder':
+        """用给定列表替换该类标签"""
+        self.tags[tag] = list(dict.fromkeys(value for value in values if value))
+        return self
+    
+    def params(self) -> Dict:
+        """生成编辑请求的参数（只包含有变化的部分）"""
+        params = {}
+        for field, value in self.fields.items():
+            if not self._field_changed(field):
+                continue
+            params[f'{field}.value'] = value if value is not None else ''
+            params[f'{field}.locked'] = 1
+        for tag, values in self.tags.items():
+            if not self._tags_changed(tag):
+                continue
+            params[f'{tag}.locked'] = 1
+            for i, value in enumerate(values):
+                params[f'{tag}[{i}].tag.tag'] = value
+                if tag == 'actor':
+                    params[f'{tag}[{i}].tagging.text'] = ''  # 角色名为空
+        return params
+    
+    def save(self) -> bool:
+        """一次请求提交所有修改，没有修改时不发送请求"""
+        params = self.params()
+        if not params:
+            return False
+        self.video.edit(**params)
+        return True
+
+
 class PlexJAVUpdater:
     """Plex JAV 元数据更新器"""
     
-    def __init__(self, plex_url: str, plex_token: str, library_name: str, rules: Dict = None):
+    # 批量添加合集时每个请求包含的视频数（ratingKey 拼接在 URL 中，避免过长）
+    COLLECTION_CHUNK_SIZE = 500
+    
+    def __init__(self, plex_url: str, plex_token: str, library_name: str, rules: Dict = None,
+                 page_size: int = 200):
         self.plex = PlexServer(plex_url, plex_token)
         self.library = self.plex.library.section(library_name)
+        self.page_size = page_size  # 分页获取库内容时每页的数量
         self.scraper = None
+        self.covers = None  # 封面存储，未设置时首次下载封面时使用默认配置创建
+        self.cover_processor = None
+        self.journal = None  # (RunState, run_id)，记录每个视频的处理进度
         self.genre_mapping = {}
         self.collection_mapping = {}
         self.rules = rules or {}
+        # 批量合集：运行期间只记录每个合集需要加入的视频，最后每个合集一次多条目编辑
+        self.bulk_collections = self.rules.get('bulk_collections', True)
+        self._pending_collections = {}  # 合集名 -> ratingKey 集合
+        self._awaiting_flush = set()  # 合集已排队的 ratingKey，合集提交后才在运行日志中记录结果
+        self._collections_lock = threading.Lock()
     
     def set_scraper(self, scraper: JavLibraryScraper):
         """设置爬虫实例"""
@@ -458,46 +1957,22 @@ class PlexJAVUpdater:
         self.genre_mapping = genre_mapping
         self.collection_mapping = collection_mapping
     
-    def _download_cover(self, cover_url: str, video_title: str) -> Optional[str]:
-        """下载封面图片并返回临时文件路径"""
-        try:
-            if not cover_url:
-                return None
-            
-            # 创建临时目录
-            temp_dir = Path(tempfile.gettempdir()) / "jav_covers"
-            temp_dir.mkdir(exist_ok=True)
-            
-            # 生成文件名（使用视频标题，避免特殊字符）
-            safe_title = re.sub(r'[^\w\-_\.]', '_', video_title)
-            temp_file = temp_dir / f"{safe_title}.jpg"
-            
-            # 如果已经下载过，直接返回
-            if temp_file.exists():
-                return str(temp_file)
-            
-            # 下载图片
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Referer': 'https://www.javlibrary.com/'
-            }
-            
-            response = requests.get(cover_url, headers=headers, timeout=30)
-            if response.status_code == 200:
-                with open(temp_file, 'wb') as f:
-                    f.write(response.content)
-                logger.info(f"封面下载成功: {temp_file.name}")
-                return str(temp_file)
-            else:
-                logger.warning(f"封面下载失败: HTTP {response.status_code}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"下载封面失败: {e}")
-            return None
+    def set_cover_store(self, cover_store: CoverStore, processor: Optional[CoverProcessor] = None):
+        """设置封面存储和（可选的）封面预处理"""
+        self.covers = cover_store
+        self.cover_processor = processor
+    
+    def _download_cover(self, cover_url: str) -> Optional[str]:
+        """下载封面图片（或复用本地已有的文件）并返回文件路径，启用预处理时返回处理后的文件"""
+        if self.covers is None:
+            self.covers = CoverStore()
+        cover_path = self.covers.get(cover_url)
+        if cover_path and self.cover_processor:
+            cover_path = self.cover_processor.process(cover_path)
+        return cover_path
     
-    def _set_video_poster(self, video, cover_path: str) -> bool:
-        """设置视频封面"""
+    def _set_video_poster(self, video, cover_path: str, cover_url: Optional[str] = None) -> bool:
+        """设置视频封面，上传文件失败时改用 cover_url 上传"""
         try:
             if not cover_path or not os.path.exists(cover_path):
                 logger.warning("封面文件路径无效")
@@ -515,7 +1990,6 @@ class PlexJAVUpdater:
             # 方法2: 尝试用 URL 方式上传
             try:
                 # 先尝试从原始 URL 直接上传
-                cover_url = getattr(self, '_last_cover_url', None)
                 if cover_url and hasattr(video, 'uploadPoster'):
                     video.uploadPoster(url=cover_url)
                     logger.debug(f"使用 uploadPoster(url) 成功")
@@ -526,192 +2000,232 @@ class PlexJAVUpdater:
             logger.error(f"所有封面上传方法都失败: 最后错误 {e}")
             return False
     
-    def get_all_videos(self) -> List:
-        """获取库中所有视频"""
-        return self.library.all()
+    @staticmethod
+    def _record_from_element(elem) -> VideoRecord:
+        """从 Plex 返回的 XML 元素构建精简记录"""
+        part = elem.find('Media/Part')
+        role = elem.find('Role')
+        return VideoRecord(
+            rating_key=int(elem.get('ratingKey')),
+            title=elem.get('title', ''),
+            file=part.get('file', '') if part is not None else '',
+            studio=elem.get('studio', ''),
+            genre_count=len(elem.findall('Genre')),
+            role_count=len(elem.findall('Role')),
+            collection_count=len(elem.findall('Collection')),
+            main_actor=role.get('tag', '') if role is not None else '',
+            added_at=int(elem.get('addedAt') or 0),
+            updated_at=int(elem.get('updatedAt') or 0),
+            has_poster=PlexJAVUpdater._has_custom_poster(elem.get('thumb'), elem.get('art')),
+        )
     
-    def update_video_metadata(self, video, metadata: Dict) -> bool:
-        """更新单个视频的元数据"""
-        try:
-            # 开始批量编辑
-            video.batchEdits()
-            
-            # 更新标题（如果原标题只是文件名）
-            if metadata['title'] and not video.title or video.title == Path(video.media[0].parts[0].file).stem:
-                video.editTitle(metadata['title'])
-            
-            # 更新类别
-            if metadata['genres']:
-                # 智能映射：检测是否需要映射（只在获取到英文时才映射）
-                genres_to_add = []
-                collections_to_add = []
-                
-                for genre in metadata['genres']:
-                    # 检查是否包含中文字符（如果已经是中文就不需要映射）
-                    if any('\u4e00' <= char <= '\u9fff' for char in genre):
-                        # 已经是中文，直接使用
-                        mapped_genre = genre
-                    else:
-                        # 英文，需要映射
-                        mapped_genre = self.genre_mapping.get(genre, genre)
-                    
-                    if mapped_genre:
-                        genres_to_add.append(mapped_genre)
-                    
-                    # 不再使用基于类别的合集映射
-                    pass
-                
-                # 添加类别
-                if genres_to_add:
-                    video.addGenre(genres_to_add)
-                    logger.info(f"添加类别: {', '.join(genres_to_add)}")
-            
-            # 创建新的合集（基于番号和演员）
-            collections_to_add = []
-            
-            # 1. 番号前缀合集
-            if metadata['code']:
-                code_prefix = metadata['code'].split('-')[0] if '-' in metadata['code'] else metadata['code'][:3]
-                collections_to_add.append(f"{code_prefix}系列")
-                logger.info(f"准备添加到系列合集: {code_prefix}系列")
-            
-            # 2. 主演员合集（第一个演员）
-            if metadata.get('actors') and len(metadata['actors']) > 0:
-                main_actor = metadata['actors'][0]
-                collections_to_add.append(f"{main_actor}作品集")
-                logger.info(f"准备添加到演员合集: {main_actor}作品集")
-            
-            # 3. 制作商合集（可选）
-            if metadata.get('studio') and self.rules.get('add_studio_collection', False):
-                collections_to_add.append(metadata['studio'])
-                logger.info(f"准备添加到制作商合集: {metadata['studio']}")
-            
-            # 添加所有合集
-            if collections_to_add:
-                # 去重
-                collections_to_add = list(set(collections_to_add))
-                video.addCollection(collections_to_add)
-                logger.info(f"✅ 添加到合集: {', '.join(collections_to_add)}")
-            
-            # 更新工作室
-            if metadata['studio']:
-                video.editStudio(metadata['studio'])
-            
-            # 更新演员（使用正确的Plex API方法）
-            if metadata.get('actors'):
-                logger.info(f"开始处理 {len(metadata['actors'])} 个演员")
-                actors_to_add = metadata['actors'][:5]  # 限制前5个演员
-                
-                try:
-                    # 方法1: 使用 edit() 方法添加演员 (推荐)
-                    edits = {}
-                    for i, actor in enumerate(actors_to_add):
-                        edits[f'actor[{i}].tag.tag'] = actor
-                        edits[f'actor[{i}].locked'] = 1
-                        edits[f'actor[{i}].tagging.text'] = ''  # 角色名为空
-                    
-                    video.edit(**edits)
-                    logger.info(f"✅ 批量添加演员成功: {', '.join(actors_to_add)}")
-                    
-                except Exception as e1:
-                    logger.debug(f"批量添加演员失败: {e1}")
-                    
-                    try:
-                        # 方法2: 使用 _edit_tags 方法
-                        for actor in actors_to_add:
-                            video._edit_tags(tag="actor", items=[actor])
-                        logger.info(f"✅ 演员添加成功(_edit_tags): {', '.join(actors_to_add)}")
-                        
-                    except Exception as e2:
-                        logger.debug(f"_edit_tags 方法失败: {e2}")
-                        
-                        # 方法3: 降级为标签
-                        for actor in actors_to_add:
-                            video.addLabel(f"演员:{actor}")
-                        logger.info(f"📋 演员作为标签添加: {', '.join(actors_to_add)}")
-                
-                # 添加演员汇总标签（方便搜索）
-                actors_tag = f"演员: {', '.join(metadata['actors'][:3])}"
-                video.addLabel(actors_tag)
-                logger.info(f"📋 演员汇总标签: {actors_tag}")
-            else:
-                logger.debug("没有演员信息")
-            
-            # 添加番号作为标签
-            if metadata['code']:
-                video.addLabel(metadata['code'])
-            
-            # 更新评分
-            if metadata['rating'] > 0:
-                try:
-                    video.editRating(metadata['rating'])
-                except AttributeError:
-                    # 某些版本的 plexapi 可能不支持 editRating
-                    logger.debug(f"跳过评分设置（API 不支持）: {metadata['rating']}")
-                    pass
+    @staticmethod
+    def _has_custom_poster(thumb: Optional[str], art: Optional[str]) -> bool:
+        """是否已上传过自定义封面"""
+        return bool((thumb and thumb.strip() and 'upload://' in thumb) or
+                    (art and art.strip() and 'upload://' in art))
+    
+    @property
+    def section_id(self) -> str:
+        """库的唯一标识（服务器 ID + 库 key），用于记录增量运行的高水位"""
+        return f"{self.plex.machineIdentifier}:{self.library.key}"
+    
+    def iter_videos(self, since: Optional[int] = None) -> Iterator[VideoRecord]:
+        """分页遍历库中视频，逐条返回精简记录（不创建完整的 Video 对象）
+        
+        since: 只返回 updatedAt 不早于该时间戳的视频（新添加的视频 updatedAt 与 addedAt 相同）
+        """
+        params = {'type': 1, 'excludeFields': 'summary,tagline'}
+        if since:
+            # Plex 的 >> 表示"晚于"，减 1 秒使边界上的视频也被包含
+            params['updatedAt>>'] = since - 1
+        start = 0
+        while True:
+            data = self.plex.query(
+                f'/library/sections/{self.library.key}/all',
+                headers={
+                    'X-Plex-Container-Start': str(start),
+                    'X-Plex-Container-Size': str(self.page_size),
+                },
+                params=params
+            )
+            elements = data.findall('Video') if data is not None else []
+            for elem in elements:
+                yield self._record_from_element(elem)
             
-            # 下载并设置封面
-            if metadata.get('cover_url') and self.rules.get('download_covers', True):
-                cover_url = metadata['cover_url']
-                logger.info(f"开始处理封面: {cover_url[:50]}...")
-                
-                # 保存cover_url供后续使用
-                self._last_cover_url = cover_url
-                
-                # 更准确的封面检测
-                has_poster = False
-                try:
-                    # 先刷新视频对象以获取最新状态
-                    video.reload()
-                    
-                    # 检查是否有自定义封面
-                    has_poster = (
-                        (hasattr(video, 'thumb') and video.thumb and 
-                         video.thumb.strip() and 'upload://' in video.thumb) or
-                        (hasattr(video, 'art') and video.art and 
-                         video.art.strip() and 'upload://' in video.art)
-                    )
-                    logger.debug(f"封面检测结果: {has_poster}")
-                    if hasattr(video, 'thumb'):
-                        logger.debug(f"当前thumb: {video.thumb}")
-                        
-                except Exception as e:
-                    logger.debug(f"封面检测异常: {e}")
-                    has_poster = False
-                
-                # 决定是否下载封面
-                should_download = not has_poster or self.rules.get('overwrite_posters', False)
-                
-                if should_download:
-                    # 方法1: 直接从URL上传（更高效）
-                    try:
-                        if hasattr(video, 'uploadPoster'):
-                            video.uploadPoster(url=cover_url)
-                            logger.info(f"✅ 封面设置成功(直接URL): {video.title}")
-                        else:
-                            raise Exception("uploadPoster 方法不存在")
-                    except Exception as e1:
-                        logger.debug(f"直接URL上传失败: {e1}")
-                        
-                        # 方法2: 下载后上传
-                        cover_path = self._download_cover(cover_url, video.title)
-                        if cover_path:
-                            if self._set_video_poster(video, cover_path):
-                                logger.info(f"✅ 封面设置成功(下载后): {video.title}")
-                            else:
-                                logger.warning(f"❌ 封面设置失败: {video.title}")
-                        else:
-                            logger.warning(f"❌ 封面下载失败: {video.title}")
-                else:
-                    logger.info(f"⏭️ 跳过封面（已存在且不覆盖）: {video.title}")
-                    
-            elif not metadata.get('cover_url'):
-                logger.debug("没有封面URL")
-            elif not self.rules.get('download_covers', True):
-                logger.debug("封面下载功能已禁用")
+            start += len(elements)
+            total_size = int(data.get('totalSize') or 0) if data is not None else 0
+            if not elements or start >= total_size:
+                break
+    
+    def get_all_videos(self) -> List[VideoRecord]:
+        """获取库中所有视频的精简记录"""
+        return list(self.iter_videos())
+    
+    def fetch_video(self, record: VideoRecord):
+        """获取需要编辑的视频的完整对象"""
+        return self.plex.fetchItem(record.rating_key)
+    
+    def fetch_records(self, rating_keys: List[int]) -> List[VideoRecord]:
+        """按 ratingKey 批量获取精简记录（一次请求），忽略不属于本库的条目"""
+        if not rating_keys:
+            return []
+        data = self.plex.query(f"/library/metadata/{','.join(str(key) for key in rating_keys)}")
+        if data is None:
+            return []
+        return [self._record_from_element(elem) for elem in data.findall('Video')
+                if elem.get('librarySectionID') in (None, str(self.library.key))]
+    
+    def _edit_item(self, rating_key, params: Dict):
+        """不获取完整对象，直接按 ratingKey 提交编辑（与 plexapi 批量编辑使用同一接口，
+        rating_key 可以是逗号分隔的多个 ratingKey）"""
+        params = {'type': 1, 'id': rating_key, **params}
+        self.plex.query(f'/library/sections/{self.library.key}/all{utils.joinArgs(params)}',
+                        method=self.plex._session.put)
+    
+    def map_genres(self, genres: List[str]) -> List[str]:
+        """智能映射：只在获取到英文类别时才使用 genre_mapping"""
+        mapped = []
+        for genre in genres:
+            # 检查是否包含中文字符（如果已经是中文就不需要映射）
+            if any('\u4e00' <= char <= '\u9fff' for char in genre):
+                mapped_genre = genre
+            else:
+                mapped_genre = self.genre_mapping.get(genre, genre)
+            if mapped_genre:
+                mapped.append(mapped_genre)
+        return mapped
+    
+    def collections_for(self, metadata: Dict) -> List[str]:
+        """根据番号、演员和制作商计算视频应加入的合集"""
+        collections = []
+        
+        # 1. 番号前缀合集
+        if metadata['code']:
+            code_prefix = metadata['code'].split('-')[0] if '-' in metadata['code'] else metadata['code'][:3]
+            collections.append(f"{code_prefix}系列")
+        
+        # 2. 主演员合集（第一个演员）
+        if metadata.get('actors'):
+            collections.append(f"{metadata['actors'][0]}作品集")
+        
+        # 3. 制作商合集（可选）
+        if metadata.get('studio') and self.rules.get('add_studio_collection', False):
+            collections.append(metadata['studio'])
+        
+        return list(dict.fromkeys(collections))
+    
+    def build_edits(self, video, metadata: Dict, include_collections: bool = True) -> PlexEditBuilder:
+        """根据爬取的元数据计算视频的目标字段和标签（include_collections=False 时合集另行批量添加）"""
+        edits = PlexEditBuilder(video)
+        
+        # 更新标题（如果原标题为空或只是文件名）
+        if metadata['title'] and (not video.title or video.title == Path(video.media[0].parts[0].file).stem):
+            edits.set_field('title', metadata['title'])
+        
+        # 更新类别
+        genres = self.map_genres(metadata['genres'])
+        if genres:
+            edits.add_tags('genre', genres)
+        
+        # 创建新的合集（基于番号和演员）
+        collections = self.collections_for(metadata)
+        if collections and include_collections:
+            edits.add_tags('collection', collections)
+        
+        # 更新工作室
+        if metadata['studio']:
+            edits.set_field('studio', metadata['studio'])
+        
+        labels = []
+        if metadata.get('actors'):
+            # 演员替换为爬取到的前 max_actors_as_tags 个
+            edits.set_tags('actor', metadata['actors'][:self.rules.get('max_actors_as_tags', 5)])
             
-            # 保存所有编辑
-            video.saveEdits()
+            # 添加演员汇总标签（方便搜索）
+            labels.append(f"演员: {', '.join(metadata['actors'][:3])}")
+        else:
+            logger.debug("没有演员信息")
+        
+        # 添加番号作为标签
+        if metadata['code']:
+            labels.append(metadata['code'])
+        if labels:
+            edits.add_tags('label', labels)
+        
+        # 更新评分（Plex 的 rating 字段，0-10 分）
+        if metadata['rating'] > 0:
+            edits.set_field('rating', metadata['rating'])
+        
+        return edits
+    
+    def _apply_cover(self, video, metadata: Dict, cover_path: Optional[str] = None, changed: bool = True):
+        """下载并设置封面（封面上传是唯一需要单独请求的修改）
+        
+        changed 为 False 表示其他元数据已是最新，说明之前已完整处理过，已有封面时不再重复上传
+        """
+        if not metadata.get('cover_url'):
+            logger.debug("没有封面URL")
+            return
+        if not self.rules.get('download_covers', True):
+            logger.debug("封面下载功能已禁用")
+            return
+        
+        cover_url = metadata['cover_url']
+        logger.info(f"开始处理封面: {cover_url[:50]}...")
+        
+        # 检查是否有自定义封面（video 是刚获取的完整对象，无需 reload）
+        has_poster = self._has_custom_poster(video.thumb, video.art)
+        logger.debug(f"封面检测结果: {has_poster}, 当前thumb: {video.thumb}")
+        
+        # 决定是否下载封面
+        if has_poster and not self.rules.get('overwrite_posters', False):
+            logger.info(f"⏭️ 跳过封面（已存在且不覆盖）: {video.title}")
+            return
+        if not changed and video.thumb:
+            logger.info(f"⏭️ 跳过封面（元数据无变化，封面已设置过）: {video.title}")
+            return
+        
+        if cover_path:
+            # 已预先下载封面，直接上传文件
+            if self._set_video_poster(video, cover_path, cover_url):
+                logger.info(f"✅ 封面设置成功(预下载): {video.title}")
+            else:
+                logger.warning(f"❌ 封面设置失败: {video.title}")
+            return
+        
+        # 方法1: 直接从URL上传（更高效）
+        try:
+            video.uploadPoster(url=cover_url)
+            logger.info(f"✅ 封面设置成功(直接URL): {video.title}")
+            return
+        except Exception as e1:
+            logger.debug(f"直接URL上传失败: {e1}")
+        
+        # 方法2: 下载后上传
+        cover_path = self._download_cover(cover_url)
+        if not cover_path:
+            logger.warning(f"❌ 封面下载失败: {video.title}")
+        elif self._set_video_poster(video, cover_path):
+            logger.info(f"✅ 封面设置成功(下载后): {video.title}")
+        else:
+            logger.warning(f"❌ 封面设置失败: {video.title}")
+    
+    def update_video_metadata(self, video, metadata: Dict, cover_path: Optional[str] = None) -> bool:
+        """更新单个视频的元数据：字段和标签合并为一次请求，封面单独上传（cover_path 为预先下载好的封面文件）"""
+        try:
+            edits = self.build_edits(video, metadata, include_collections=not self.bulk_collections)
+            if self.bulk_collections:
+                current = set(edits.current_tags('collection'))
+                self.queue_collections(video.ratingKey,
+                                       [name for name in self.collections_for(metadata) if name not in current])
+            changes = edits.changes()
+            if changes:
+                logger.info(f"✏️ 更新: {PlexEditBuilder.describe(changes)}")
+                edits.save()
+            else:
+                logger.info(f"⏭️ 元数据无变化，跳过写入: {video.title}")
+            self._apply_cover(video, metadata, cover_path, changed=bool(changes))
             
             logger.info(f"成功更新 {video.title} 的元数据")
             return True
@@ -720,47 +2234,212 @@ class PlexJAVUpdater:
             logger.error(f"更新 {video.title} 失败: {e}")
             return False
     
-    def process_video(self, video) -> Tuple[str, bool, Optional[Dict]]:
-        """处理单个视频"""
-        filename = Path(video.media[0].parts[0].file).name
-        
-        # 提取番号
-        jav_code = JAVNumberExtractor.extract(filename)
-        if not jav_code:
+    def set_journal(self, state: Optional[RunState], run_id: Optional[int] = None):
+        """设置运行日志（传入 None 停止记录）"""
+        self.journal = (state, run_id) if state else None
+    
+    def mark(self, record: VideoRecord, state: str, reason: Optional[str] = None):
+        """在运行日志中记录视频的处理状态"""
+        self._mark_key(record.rating_key, state, reason)
+    
+    def _mark_key(self, rating_key: int, state: str, reason: Optional[str] = None):
+        if self.journal:
+            run_state, run_id = self.journal
+            run_state.record(run_id, rating_key, state, reason)
+    
+    def mark_applied(self, record: VideoRecord):
+        """记录写入完成；合集还在批量队列中的视频由 flush_collections 提交后再记录"""
+        with self._collections_lock:
+            if int(record.rating_key) in self._awaiting_flush:
+                return
+        self.mark(record, 'applied')
+    
+    def mark_failed(self, record: VideoRecord, reason: str):
+        """记录失败，已排队的合集照常提交，但不再覆盖为 applied"""
+        with self._collections_lock:
+            self._awaiting_flush.discard(int(record.rating_key))
+        self.mark(record, 'failed', reason)
+    
+    def extract_code(self, record: VideoRecord) -> Tuple[str, Optional[str]]:
+        """提取视频文件名和番号"""
+        filename = Path(record.file).name
+        return filename, JAVNumberExtractor.extract(filename)
+    
+    def resolve_code(self, record: VideoRecord) -> Tuple[str, Optional[str]]:
+        """提取番号并记录到运行日志"""
+        filename, jav_code = self.extract_code(record)
+        if jav_code:
+            logger.info(f"处理: {filename} -> 番号: {jav_code}")
+            self.mark(record, 'extracted')
+        else:
             logger.warning(f"无法从 {filename} 提取番号")
-            return filename, False, None
-        
-        logger.info(f"处理: {filename} -> 番号: {jav_code}")
-        
+            self.mark(record, 'failed', '无法提取番号')
+        return filename, jav_code
+    
+    def scrape(self, record: VideoRecord, jav_code: str) -> Optional[Dict]:
+        """爬取元数据并记录到运行日志"""
+        metadata = self.scraper.search_by_code(jav_code)
+        if metadata:
+            self.mark(record, 'scraped')
+        elif self.scraper.confirmed_missing(jav_code):
+            logger.warning(f"未找到 {jav_code} 的元数据")
+            self.mark(record, 'failed', '未找到元数据')
+        else:
+            logger.warning(f"获取 {jav_code} 的元数据失败")
+            self.mark(record, 'failed', '获取元数据失败')
+        return metadata
+    
+    def plan_video(self, record: VideoRecord) -> str:
+        """决定处理方式，跳过的视频记录到运行日志"""
+        action = self.classify(record)
+        if action == 'skip':
+            self.mark(record, 'skipped')
+        return action
+    
+    @staticmethod
+    def classify(record: VideoRecord) -> str:
+        """根据已有元数据决定处理方式：scrape（需要爬取）、collections（仅更新合集）、skip（跳过），没有副作用"""
         # 检查是否已有完整信息（避免重复请求JavLibrary）
-        has_genres = len(video.genres) > 0
-        has_actors = hasattr(video, 'roles') and len(video.roles) > 0
-        has_studio = hasattr(video, 'studio') and video.studio
-        has_collections = len(video.collections) > 0
+        has_genres = record.genre_count > 0
+        has_actors = record.role_count > 0
+        has_studio = bool(record.studio)
+        has_collections = record.collection_count > 0
         
         # 如果已有基本信息（类别和演员/制作商），但没有合集，只创建合集
         if has_genres and (has_actors or has_studio) and not has_collections:
-            logger.info(f"⚡ 已有元数据，仅创建合集: {jav_code}")
-            
-            # 创建番号前缀合集
-            code_prefix = jav_code.split('-')[0] if '-' in jav_code else jav_code[:3]
-            video.addCollection(f"{code_prefix}系列")
-            logger.info(f"✅ 添加到系列合集: {code_prefix}系列")
-            
-            # 如果有演员，创建演员合集
-            if has_actors:
-                try:
-                    main_actor = video.roles[0].tag if video.roles else None
-                    if main_actor:
-                        video.addCollection(f"{main_actor}作品集")
-                        logger.info(f"✅ 添加到演员合集: {main_actor}作品集")
-                except:
-                    pass
-            
-            return filename, True, {"code": jav_code, "action": "仅更新合集"}
+            return 'collections'
         
         # 如果已有完整信息（包括合集），跳过处理
         if has_genres and has_collections:
+            return 'skip'
+        
+        return 'scrape'
+    
+    def queue_collections(self, rating_key: int, collections: List[str]):
+        """记录视频需要加入的合集，由 flush_collections 统一提交"""
+        if not collections:
+            return
+        with self._collections_lock:
+            for name in collections:
+                self._pending_collections.setdefault(name, set()).add(int(rating_key))
+            self._awaiting_flush.add(int(rating_key))
+    
+    def flush_collections(self) -> int:
+        """每个合集用一次多条目编辑（id=rk1,rk2,...）把本次运行中记录的视频加入合集，返回请求数
+        
+        多条目编辑时提交的标签会追加到每个视频已有的标签上，不会替换。
+        所有合集提交后才在运行日志中把等待的视频记录为 applied，任一合集失败则记录为 failed
+        """
+        with self._collections_lock:
+            pending, self._pending_collections = self._pending_collections, {}
+            awaiting, self._awaiting_flush = self._awaiting_flush, set()
+        
+        requests_sent = 0
+        failed = {}  # ratingKey -> 失败原因
+        for name, rating_keys in sorted(pending.items()):
+            keys = sorted(rating_keys)
+            for i in range(0, len(keys), self.COLLECTION_CHUNK_SIZE):
+                chunk = keys[i:i + self.COLLECTION_CHUNK_SIZE]
+                try:
+                    self._edit_item(','.join(str(key) for key in chunk),
+                                    {'collection[0].tag.tag': name, 'collection.locked': 1})
+                    requests_sent += 1
+                except Exception as e:
+                    logger.error(f"批量添加合集 {name} 失败: {e}")
+                    for key in chunk:
+                        failed.setdefault(key, f"批量添加合集 {name} 失败: {e}")
+            logger.info(f"📁 合集 {name}: 添加 {len(keys)} 个视频")
+        
+        for key in awaiting:
+            if key in failed:
+                self._mark_key(key, 'failed', failed[key])
+            else:
+                self._mark_key(key, 'applied')
+        return requests_sent
+    
+    def update_collections_only(self, record: VideoRecord, jav_code: str) -> bool:
+        """已有元数据的视频只添加系列和演员合集（一次请求，不获取完整对象）"""
+        # 创建番号前缀合集
+        code_prefix = jav_code.split('-')[0] if '-' in jav_code else jav_code[:3]
+        collections = [f"{code_prefix}系列"]
+        
+        # 如果有演员，创建演员合集
+        if record.main_actor:
+            collections.append(f"{record.main_actor}作品集")
+        
+        if self.bulk_collections:
+            # 合集提交后由 flush_collections 记录结果
+            self.queue_collections(record.rating_key, collections)
+            return True
+        
+        # 走到这里说明该视频还没有任何合集，直接设置即可，无需合并已有标签
+        params = {f'collection[{i}].tag.tag': tag for i, tag in enumerate(collections)}
+        params['collection.locked'] = 1
+        try:
+            self._edit_item(record.rating_key, params)
+        except Exception as e:
+            logger.error(f"更新 {record.title} 的合集失败: {e}")
+            self.mark(record, 'failed', f"更新合集失败: {e}")
+            return False
+        self.mark(record, 'applied')
+        
+        logger.info(f"✅ 添加到系列合集: {collections[0]}")
+        if len(collections) > 1:
+            logger.info(f"✅ 添加到演员合集: {collections[1]}")
+        return True
+    
+    def prepare_cover(self, record: VideoRecord, metadata: Dict) -> Optional[str]:
+        """启用 upload_covers_from_file 或封面预处理时预先下载（并处理）封面，返回本地文件路径
+        
+        已有封面且不覆盖时 _apply_cover 不会上传，此时不下载
+        """
+        if not (metadata.get('cover_url') and
+                self.rules.get('download_covers', True) and
+                (self.rules.get('upload_covers_from_file', False) or self.cover_processor)):
+            return None
+        if record.has_poster and not self.rules.get('overwrite_posters', False):
+            return None
+        return self._download_cover(metadata['cover_url'])
+    
+    def preview_metadata(self, record: VideoRecord, metadata: Dict) -> Dict[str, Tuple]:
+        """测试模式：只计算并输出将要写入的修改，不更新 Plex"""
+        edits = self.build_edits(self.fetch_video(record), metadata)
+        changes = edits.changes()
+        if changes:
+            logger.info(f"🔍 {metadata['code']} 将修改: {PlexEditBuilder.describe(changes)}")
+        else:
+            logger.info(f"🔍 {metadata['code']} 无需修改")
+        return changes
+    
+    def apply_metadata(self, record: VideoRecord, metadata: Dict, cover_path: Optional[str] = None) -> bool:
+        """获取完整对象并写入元数据"""
+        try:
+            video = self.fetch_video(record)
+        except Exception as e:
+            logger.error(f"获取 {record.title} 失败: {e}")
+            self.mark(record, 'failed', f"获取视频失败: {e}")
+            return False
+        success = self.update_video_metadata(video, metadata, cover_path)
+        if success:
+            self.mark_applied(record)
+        else:
+            self.mark_failed(record, '写入 Plex 失败')
+        return success
+    
+    def process_video(self, record: VideoRecord, dry_run: bool = False) -> Tuple[str, bool, Optional[Dict]]:
+        """处理单个视频（dry_run 时跳过判断，只爬取元数据并输出将要写入的修改）"""
+        # 提取番号
+        filename, jav_code = self.resolve_code(record)
+        if not jav_code:
+            return filename, False, None
+        
+        action = 'scrape' if dry_run else self.plan_video(record)
+        if action == 'collections':
+            logger.info(f"⚡ 已有元数据，仅创建合集: {jav_code}")
+            self.update_collections_only(record, jav_code)
+            return filename, True, {"code": jav_code, "action": "仅更新合集"}
+        
+        if action == 'skip':
             logger.info(f"⚡ 跳过已处理的视频: {jav_code}")
             return filename, True, {"code": jav_code, "action": "跳过已处理"}
         
@@ -769,22 +2448,430 @@ class PlexJAVUpdater:
             logger.error("未设置爬虫实例")
             return filename, False, None
         
-        metadata = self.scraper.search_by_code(jav_code)
+        metadata = self.scrape(record, jav_code)
         if not metadata:
-            logger.warning(f"未找到 {jav_code} 的元数据")
             return filename, False, None
         
-        # 调试：输出获取到的元数据
+        self._log_metadata(metadata)
+        
+        if dry_run:
+            logger.info(f"找到 {jav_code}: {metadata['title']}, 类别: {', '.join(metadata['genres'])}")
+            self.preview_metadata(record, metadata)
+            return filename, True, metadata
+        
+        # 更新 Plex
+        cover_path = self.prepare_cover(record, metadata)
+        success = self.apply_metadata(record, metadata, cover_path)
+        
+        return filename, success, metadata
+    
+    @staticmethod
+    def _log_metadata(metadata: Dict):
+        """调试：输出获取到的元数据"""
         logger.debug(f"获取到的元数据: 演员={len(metadata.get('actors', []))}个, 封面={'有' if metadata.get('cover_url') else '无'}")
         if metadata.get('actors'):
             logger.info(f"演员列表: {', '.join(metadata['actors'][:3])}")
         if metadata.get('cover_url'):
             logger.info(f"封面URL: {metadata['cover_url'][:50]}...")
+
+
+class StagedPipeline:
+    """分阶段处理流水线：提取 → 解析 → 爬取 → 封面 → 写入
+    
+    各阶段有独立的工作线程数，阶段之间通过有界队列连接并形成反压；
+    爬取阶段等待限速时，写入阶段仍可继续处理已爬取的结果，
+    总耗时由最慢的阶段决定，而不是各阶段耗时之和。
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, updater: PlexJAVUpdater, engine_config: Dict, dry_run: bool = False):
+        self.updater = updater
+        self.dry_run = dry_run
+        self.queue_size = engine_config.get('queue_size', 100)
+        # (阶段名, 处理函数, 工作线程数)
+        self.stages = [
+            ('extract', self._extract, engine_config.get('extract_workers', 1)),
+            ('resolve', self._resolve, engine_config.get('resolve_workers', 4)),
+            ('scrape', self._scrape, engine_config.get('scrape_workers', 2)),
+            ('cover', self._cover, engine_config.get('cover_workers', 8)),
+            ('apply', self._apply, engine_config.get('apply_workers', 4)),
+        ]
+        self.results = queue.Queue()
+    
+    # 各阶段处理函数：返回 dict 表示交给下一阶段，返回元组表示该视频处理结束
+    
+    def _extract(self, item: Dict):
+        item['filename'], item['code'] = self.updater.resolve_code(item['video'])
+        if not item['code']:
+            return item['filename'], False, None
+        return item
+    
+    def _resolve(self, item: Dict):
+        if self.dry_run:
+            return item
+        video, jav_code = item['video'], item['code']
+        action = self.updater.plan_video(video)
+        if action == 'collections':
+            logger.info(f"⚡ 已有元数据，仅创建合集: {jav_code}")
+            self.updater.update_collections_only(video, jav_code)
+            return item['filename'], True, {"code": jav_code, "action": "仅更新合集"}
+        if action == 'skip':
+            logger.info(f"⚡ 跳过已处理的视频: {jav_code}")
+            return item['filename'], True, {"code": jav_code, "action": "跳过已处理"}
+        return item
+    
+    def _scrape(self, item: Dict):
+        metadata = self.updater.scrape(item['video'], item['code'])
+        if not metadata:
+            return item['filename'], False, None
+        if self.dry_run:
+            logger.info(f"找到 {item['code']}: {metadata['title']}, 类别: {', '.join(metadata['genres'])}")
+        item['metadata'] = metadata
+        return item
+    
+    def _cover(self, item: Dict):
+        # 封面下载和预处理在单独的阶段进行，不占用写入阶段的线程
+        if not self.dry_run:
+            item['cover_path'] = self.updater.prepare_cover(item['video'], item['metadata'])
+        return item
+    
+    def _apply(self, item: Dict):
+        video, metadata = item['video'], item['metadata']
+        if self.dry_run:
+            self.updater.preview_metadata(video, metadata)
+            return item['filename'], True, metadata
+        self.updater._log_metadata(metadata)
+        success = self.updater.apply_metadata(video, metadata, item.get('cover_path'))
+        return item['filename'], success, metadata
+    
+    def _run_stage(self, name: str, func, in_q: queue.Queue, out_q: Optional[queue.Queue],
+                   next_workers: int, state: Dict):
+        """阶段工作线程：处理输入队列直到收到结束标记"""
+        while True:
+            item = in_q.get()
+            if item is self._STOP:
+                break
+            try:
+                output = func(item)
+            except Exception as e:
+                logger.error(f"[{name}] 处理失败: {e}")
+                self.updater.mark_failed(item['video'], str(e))
+                output = (item.get('filename') or str(getattr(item['video'], 'title', '')), False, None)
+            
+            if isinstance(output, dict):
+                out_q.put(output)  # 队列已满时阻塞，形成反压
+            else:
+                self.results.put(output)
         
-        # 更新 Plex
-        success = self.update_video_metadata(video, metadata)
+        # 本阶段最后一个退出的线程通知下一阶段结束
+        with state['lock']:
+            state['remaining'] -= 1
+            last = state['remaining'] == 0
+        if last and out_q is not None:
+            for _ in range(next_workers):
+                out_q.put(self._STOP)
+    
+    def run(self, videos: List) -> List[Tuple[str, bool, Optional[Dict]]]:
+        """运行流水线，返回每个视频的 (文件名, 是否成功, 元数据)"""
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = []
+        
+        for index, (name, func, workers) in enumerate(self.stages):
+            has_next = index + 1 < len(self.stages)
+            out_q = queues[index + 1] if has_next else None
+            next_workers = self.stages[index + 1][2] if has_next else 0
+            state = {'remaining': workers, 'lock': threading.Lock()}
+            for n in range(workers):
+                thread = threading.Thread(
+                    target=self._run_stage,
+                    args=(name, func, queues[index], out_q, next_workers, state),
+                    name=f"{name}-{n}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
         
+        def feed():
+            for video in videos:
+                queues[0].put({'video': video})
+            for _ in range(self.stages[0][2]):
+                queues[0].put(self._STOP)
+        
+        feeder = threading.Thread(target=feed, name="feeder", daemon=True)
+        feeder.start()
+        
+        results = []
+        with tqdm(total=len(videos), desc="处理进度") as pbar:
+            for _ in range(len(videos)):
+                results.append(self.results.get())
+                pbar.update(1)
+        
+        feeder.join()
+        for thread in threads:
+            thread.join()
+        return results
+
+
+async def run_async_engine(updater: PlexJAVUpdater, videos: List, engine_config: Dict,
+                           dry_run: bool = False) -> List[Tuple[str, bool, Optional[Dict]]]:
+    """asyncio 处理引擎：JavLibrary 请求、封面下载、Plex 写入分别限制并发
+    
+    plexapi/cloudscraper 都是阻塞库，各阶段的调用在共享线程池中执行，
+    由事件循环按各自的并发上限调度；JavLibrary 请求仍受共享限速器约束。
+    固定数量的工作协程从有界队列中取视频，内存占用不随视频数量增长。
+    """
+    scrape_workers = engine_config.get('scrape_workers', 2)
+    cover_workers = engine_config.get('cover_workers', 8)
+    plex_workers = engine_config.get('plex_workers', 8)
+    
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=scrape_workers + cover_workers + plex_workers)
+    scrape_sem = asyncio.Semaphore(scrape_workers)
+    cover_sem = asyncio.Semaphore(cover_workers)
+    plex_sem = asyncio.Semaphore(plex_workers)
+    
+    async def run(sem: asyncio.Semaphore, func, *args):
+        async with sem:
+            return await loop.run_in_executor(executor, func, *args)
+    
+    async def handle(video) -> Tuple[str, bool, Optional[Dict]]:
+        # 运行日志写入可能触发 fsync，不能在事件循环线程中执行
+        filename, jav_code = await loop.run_in_executor(executor, updater.resolve_code, video)
+        if not jav_code:
+            return filename, False, None
+        
+        if not dry_run:
+            action = await run(plex_sem, updater.plan_video, video)
+            if action == 'collections':
+                logger.info(f"⚡ 已有元数据，仅创建合集: {jav_code}")
+                await run(plex_sem, updater.update_collections_only, video, jav_code)
+                return filename, True, {"code": jav_code, "action": "仅更新合集"}
+            if action == 'skip':
+                logger.info(f"⚡ 跳过已处理的视频: {jav_code}")
+                return filename, True, {"code": jav_code, "action": "跳过已处理"}
+        
+        metadata = await run(scrape_sem, updater.scrape, video, jav_code)
+        if not metadata:
+            return filename, False, None
+        
+        if dry_run:
+            logger.info(f"找到 {jav_code}: {metadata['title']}, 类别: {', '.join(metadata['genres'])}")
+            await run(plex_sem, updater.preview_metadata, video, metadata)
+            return filename, True, metadata
+        
+        updater._log_metadata(metadata)
+        cover_path = await run(cover_sem, updater.prepare_cover, video, metadata)
+        success = await run(plex_sem, updater.apply_metadata, video, metadata, cover_path)
         return filename, success, metadata
+    
+    async def guarded(video) -> Tuple[str, bool, Optional[Dict]]:
+        try:
+            return await handle(video)
+        except Exception as e:
+            logger.error(f"处理失败: {e}")
+            updater.mark_failed(video, str(e))
+            return str(getattr(video, 'title', video)), False, None
+    
+    # 工作协程数等于各阶段并发上限之和，足以让每个阶段都跑满
+    worker_count = scrape_workers + cover_workers + plex_workers
+    pending = asyncio.Queue(maxsize=worker_count * 2)
+    results = []
+    
+    async def feed():
+        for video in videos:
+            await pending.put(video)
+        for _ in range(worker_count):
+            await pending.put(None)
+    
+    async def worker(pbar):
+        while True:
+            video = await pending.get()
+            if video is None:
+                return
+            results.append(await guarded(video))
+            pbar.update(1)
+    
+    try:
+        with tqdm(total=len(videos), desc="处理进度") as pbar:
+            await asyncio.gather(feed(), *(worker(pbar) for _ in range(worker_count)))
+    finally:
+        executor.shutdown(wait=False)
+    
+    return results
+
+
+def process_videos(updater: PlexJAVUpdater, videos: List, engine: str, engine_config: Dict,
+                   threads: int = 2, dry_run: bool = False) -> Tuple[int, int, List[str]]:
+    """使用指定引擎处理一批视频，返回 (成功数, 失败数, 结果列表)"""
+    # 同一番号的多个文件只爬取一次
+    if updater.scraper:
+        duplicates = updater.scraper.expect(updater.extract_code(video)[1] for video in videos)
+        if duplicates:
+            logger.info(f"🔗 {len(duplicates)} 个番号对应多个文件，每个番号只爬取一次")
+    try:
+        return _process_videos(updater, videos, engine, engine_config, threads, dry_run)
+    finally:
+        if updater.scraper:
+            updater.scraper.clear_expected()
+
+
+def _process_videos(updater: PlexJAVUpdater, videos: List, engine: str, engine_config: Dict,
+                    threads: int, dry_run: bool) -> Tuple[int, int, List[str]]:
+    success_count = 0
+    failed_count = 0
+    results = []
+    
+    if engine in ('async', 'pipeline'):
+        if engine == 'async':
+            logger.info(f"使用 asyncio 引擎 (爬取:{engine_config.get('scrape_workers', 2)}, "
+                        f"封面:{engine_config.get('cover_workers', 8)}, Plex:{engine_config.get('plex_workers', 8)})")
+            engine_results = asyncio.run(run_async_engine(updater, videos, engine_config, dry_run=dry_run))
+        else:
+            logger.info("使用分阶段流水线引擎")
+            engine_results = StagedPipeline(updater, engine_config, dry_run=dry_run).run(videos)
+        
+        for filename, success, metadata in engine_results:
+            if success:
+                success_count += 1
+                results.append(f"✓ {filename}")
+            else:
+                failed_count += 1
+                results.append(f"✗ {filename}")
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            # 测试模式：只获取元数据并输出将要写入的修改
+            futures = {executor.submit(updater.process_video, video, dry_run): video for video in videos}
+            
+            # 使用进度条
+            with tqdm(total=len(futures), desc="处理进度") as pbar:
+                for future in as_completed(futures):
+                    try:
+                        filename, success, metadata = future.result()
+                        if success:
+                            success_count += 1
+                            results.append(f"✓ {filename}")
+                        else:
+                            failed_count += 1
+                            results.append(f"✗ {filename}")
+                        
+                    except Exception as e:
+                        failed_count += 1
+                        logger.error(f"处理失败: {e}")
+                        updater.mark_failed(futures[future], str(e))
+                    
+                    pbar.update(1)
+    
+    # 批量提交本批视频的合集
+    if not dry_run and updater.bulk_collections:
+        requests_sent = updater.flush_collections()
+        if requests_sent:
+            logger.info(f"合集更新完成，共 {requests_sent} 个请求")
+    
+    return success_count, failed_count, results
+
+
+class LibraryWatcher:
+    """监听 Plex 服务器通知，将本库新处理完成的视频去抖后分批交给 handler
+    
+    event_source: 接收回调函数并开始推送通知的工厂，返回带 stop() 的对象；
+    默认使用 plexapi 的 AlertListener，测试时可传入本地模拟的通知源
+    """
+    
+    def __init__(self, updater: PlexJAVUpdater, handler, debounce: float = 5.0,
+                 batch_size: int = 50, max_wait: float = 60.0, processed_states: Tuple = (5,),
+                 event_source=None):
+        self.updater = updater
+        self.handler = handler
+        self.debounce = debounce  # 最后一条通知之后静默多久再处理
+        self.batch_size = batch_size  # 每批最多处理的视频数
+        self.max_wait = max_wait  # 持续收到通知时，最早的通知最多等待多久
+        # 库扫描通知中表示条目已处理完成的 state：设置了元数据代理的库为 5，未设置代理的库以 1 结束
+        self.processed_states = {int(state) for state in processed_states}
+        self.event_source = event_source or self._plex_event_source
+        self.section_key = str(updater.library.key)
+        self._pending = {}  # ratingKey -> 首次收到通知的时间
+        self._last_event = 0.0
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+    
+    def _plex_event_source(self, callback):
+        if websocket is None:
+            raise RuntimeError("--watch 需要安装 websocket-client: pip install websocket-client")
+        return self.updater.plex.startAlertListener(
+            callback, callbackError=lambda error: logger.warning(f"Plex 通知连接异常: {error}")
+        )
+    
+    def on_alert(self, data: Dict):
+        """AlertListener 回调：只保留本库中处理完成的视频"""
+        if data.get('type') != 'timeline':
+            return
+        keys = []
+        for entry in data.get('TimelineEntry', []):
+            if (entry.get('identifier') == 'com.plexapp.plugins.library'
+                    and str(entry.get('sectionID')) == self.section_key
+                    and int(entry.get('type', 0)) == 1
+                    and int(entry.get('state', -1)) in self.processed_states
+                    and entry.get('itemID')):
+                keys.append(int(entry['itemID']))
+        if not keys:
+            return
+        with self._cond:
+            now = time.monotonic()
+            for key in keys:
+                self._pending.setdefault(key, now)
+            self._last_event = now
+            self._cond.notify()
+    
+    def _next_batch(self) -> List[int]:
+        """等待通知静默 debounce 秒、攒满 batch_size 或最早通知超过 max_wait 后取出一批"""
+        with self._cond:
+            while not self._stopped.is_set():
+                if not self._pending:
+                    self._cond.wait(1.0)
+                    continue
+                now = time.monotonic()
+                oldest = min(self._pending.values())
+                deadline = min(self._last_event + self.debounce, oldest + self.max_wait)
+                if len(self._pending) >= self.batch_size or now >= deadline:
+                    batch = sorted(self._pending, key=self._pending.get)[:self.batch_size]
+                    for key in batch:
+                        del self._pending[key]
+                    return batch
+                self._cond.wait(deadline - now)
+        return []
+    
+    def stop(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+    
+    def run(self):
+        """阻塞运行直到 stop() 或 Ctrl+C；通知连接断开时自动重连"""
+        listener = self.event_source(self.on_alert)
+        logger.info(f"👀 开始监听库 {self.updater.library.title} 的新增视频")
+        try:
+            while not self._stopped.is_set():
+                batch = self._next_batch()
+                if batch:
+                    logger.info(f"📥 收到 {len(batch)} 个新视频")
+                    try:
+                        self.handler(batch)
+                    except Exception as e:
+                        logger.error(f"处理新视频失败: {e}")
+                is_alive = getattr(listener, 'is_alive', None)
+                if is_alive is not None and not is_alive() and not self._stopped.is_set():
+                    logger.warning("Plex 通知连接已断开，5 秒后重连")
+                    time.sleep(5)
+                    listener = self.event_source(self.on_alert)
+        except KeyboardInterrupt:
+            logger.info("停止监听")
+        finally:
+            self._stopped.set()
+            try:
+                listener.stop()
+            except Exception:
+                pass
 
 
 def load_config(config_path: str) -> Dict:
@@ -800,12 +2887,44 @@ def main():
     parser.add_argument('--code', help='只处理指定番号')
     parser.add_argument('--dry-run', action='store_true', help='测试模式，不实际更新')
     parser.add_argument('--threads', type=int, default=2, help='并发线程数')
+    parser.add_argument('--prefetch', action='store_true', help='处理前按系列批量预取详情页索引')
+    parser.add_argument('--reparse-cache', action='store_true', help='用多进程重新解析缓存中保存的详情页后退出')
+    parser.add_argument('--engine', choices=['threads', 'async', 'pipeline'], help='处理引擎（默认读取配置 engine.type）')
+    parser.add_argument('--full', action='store_true', help='忽略增量高水位，重新扫描整个库')
+    parser.add_argument('--watch', action='store_true', help='处理完成后持续监听 Plex 通知，自动处理新增视频')
+    parser.add_argument('--resume', action='store_true', help='继续上次中断的运行，跳过已处理完成的视频')
+    parser.add_argument('--retry-failed', action='store_true', help='只重新处理上次运行中失败的视频')
     
     args = parser.parse_args()
     
     # 加载配置
     config = load_config(args.config)
     
+    # 初始化本地缓存
+    cache_config = config.get('cache', {})
+    cache = None
+    if cache_config.get('enabled', True):
+        cache = MetadataCache(
+            path=cache_config.get('path', 'cache/javlibrary.db'),
+            ttl=cache_config.get('ttl', 30 * 86400),
+            negative_ttl=cache_config.get('negative_ttl', 86400),
+            store_html=cache_config.get('store_html', False)
+        )
+    
+    # 初始化限速器（可选跨进程共享）
+    javlibrary_config = config.get('javlibrary', {})
+    limiter_factory = None
+    if javlibrary_config.get('shared_limiter'):
+        # 每个镜像在状态文件中按主机名使用独立的额度
+        def limiter_factory(host):
+            return SharedRateLimiter(
+                path=javlibrary_config['shared_limiter'],
+                rate_limit=javlibrary_config.get('rate_limit', 1.0),
+                burst=javlibrary_config.get('burst', 1),
+                name=host
+            )
+        logger.info(f"使用跨进程共享限速: {javlibrary_config['shared_limiter']}")
+    
     # 初始化爬虫
     scraper = JavLibraryScraper(
         base_url=config.get('javlibrary', {}).get('base_url', 'https://www.javlibrary.com'),
@@ -815,94 +2934,205 @@ def main():
         cookies=config.get('javlibrary', {}).get('cookies'),
         user_agent=config.get('javlibrary', {}).get('user_agent'),
         rate_limit=config.get('javlibrary', {}).get('rate_limit', 1.0),  # 请求间隔
-        max_retries=config.get('javlibrary', {}).get('max_retries', 3)  # 最大重试次数
+        max_retries=config.get('javlibrary', {}).get('max_retries', 3),  # 最大重试次数
+        cache=cache,
+        burst=config.get('javlibrary', {}).get('burst', 1),  # 突发请求数
+        limiter_factory=limiter_factory,
+        parser_backend=config.get('javlibrary', {}).get('parser', 'auto'),  # 详情页解析后端
+        parse_workers=config.get('javlibrary', {}).get('parse_workers', 0),  # 解析进程数
+        session_pool_size=config.get('javlibrary', {}).get('session_pool', 2),  # 会话池大小
+        session_file=config.get('javlibrary', {}).get('session_file', 'cache/cf_session.json')
     )
     
+    if len(scraper.mirrors) > 1:
+        logger.info(f"🪞 使用 {len(scraper.mirrors)} 个镜像: {', '.join(m.host for m in scraper.mirrors)}")
+    
+    # 只重新解析缓存的详情页，不连接 Plex
+    if args.reparse_cache:
+        count = scraper.reparse_cached_pages()
+        scraper.close()
+        if cache:
+            cache.close()
+        logger.info(f"重新解析完成，共 {count} 个详情页")
+        return
+    
     # 初始化 Plex 更新器
     updater = PlexJAVUpdater(
         plex_url=config['plex']['url'],
         plex_token=config['plex']['token'],
         library_name=config['plex']['library'],
-        rules=config.get('rules', {})
+        rules=config.get('rules', {}),
+        page_size=config['plex'].get('page_size', 200)
     )
     updater.set_scraper(scraper)
+    covers_config = config.get('covers', {})
+    cover_store = CoverStore(
+        path=covers_config.get('path', 'cache/covers'),
+        max_size_mb=covers_config.get('max_size_mb', 500),
+        pool_size=covers_config.get('pool_size', 8),
+        user_agent=javlibrary_config.get('user_agent')
+    )
+    cover_processor = None
+    if covers_config.get('process', False):
+        if Image is None:
+            logger.warning("未安装 Pillow，跳过封面预处理 (pip install Pillow)")
+        else:
+            cover_processor = CoverProcessor(
+                max_width=covers_config.get('max_width', 600),
+                max_height=covers_config.get('max_height', 900),
+                quality=covers_config.get('quality', 85),
+                crop_poster=covers_config.get('crop_poster', True),
+                workers=covers_config.get('workers', 2),
+                store=cover_store
+            )
+    updater.set_cover_store(cover_store, cover_processor)
+    
+    def close_resources():
+        """释放爬虫的进程池和会话、封面的连接和进程池以及缓存数据库"""
+        scraper.close()
+        if cover_processor:
+            cover_processor.close()
+        cover_store.close()
+        if cache:
+            cache.close()
     updater.set_mappings(
         genre_mapping=config.get('genre_mapping', {}),
         collection_mapping=config.get('collection_mapping', {})
     )
     
-    # 获取所有视频
-    videos = updater.get_all_videos()
+    # 增量模式：只枚举上次完整运行之后新增或更新的视频
+    state_config = config.get('state', {})
+    state = RunState(
+        state_config.get('path', 'cache/state.db'),
+        flush_every=state_config.get('journal_flush_every', 100),
+        flush_interval=state_config.get('journal_flush_interval', 5.0)
+    )
+    section = updater.section_id
+    watermark = None
+    if state_config.get('incremental', True) and not args.full and not args.code and not args.retry_failed:
+        watermark = state.get_watermark(updater.section_id)
+        if watermark:
+            logger.info(f"增量模式：只处理 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(watermark[1]))} "
+                        f"之后新增或更新的视频（使用 --full 重新扫描整个库）")
+    since = watermark[1] if watermark else None
+    
+    run_id = None
+    if args.retry_failed:
+        # 只获取上次运行中失败的视频
+        run_id = state.find_run(section)
+        if run_id is None:
+            logger.error("没有找到之前的运行记录，无法重试")
+            state.close()
+            close_resources()
+            return
+        failed_keys = sorted(key for key, (item_state, _) in state.run_states(run_id).items()
+                             if item_state == 'failed')
+        videos = []
+        for i in range(0, len(failed_keys), updater.page_size):
+            videos.extend(updater.fetch_records(failed_keys[i:i + updater.page_size]))
+        logger.info(f"重试上次运行中失败的 {len(videos)} 个视频")
+    else:
+        # 分页获取视频记录（--limit 时只读取需要的部分）
+        videos = list(islice(updater.iter_videos(since), args.limit)) if args.limit else list(updater.iter_videos(since))
+    enumerated = len(videos)
+    listed = videos
+    
+    # 本次枚举到的最大 addedAt/updatedAt，完整运行结束后作为新的高水位
+    new_watermark = (max((video.added_at for video in videos), default=0),
+                     max((video.updated_at for video in videos), default=0))
     
-    if args.limit:
-        videos = videos[:args.limit]
+    if watermark and not (args.resume or args.limit):
+        # 无法识别番号或站点上没有的视频不阻止高水位推进，也就不会再被增量枚举：
+        # 把上次运行中失败且本次没有枚举到的视频按 ratingKey 取回重试
+        # （无番号的文件不发出 JavLibrary 请求，未找到的番号受负缓存约束）
+        last_run = state.find_run(section)
+        listed_keys = {video.rating_key for video in videos}
+        retry_keys = sorted(key for key, (item_state, _) in
+                            (state.run_states(last_run).items() if last_run else [])
+                            if item_state == 'failed' and key not in listed_keys)
+        if retry_keys:
+            retried = []
+            for i in range(0, len(retry_keys), updater.page_size):
+                retried.extend(updater.fetch_records(retry_keys[i:i + updater.page_size]))
+            videos = videos + retried
+            logger.info(f"重试上次运行中失败的 {len(retried)} 个视频")
+    
+    if args.resume and not args.retry_failed:
+        # 继续上次未完成的运行：跳过已完成和已失败的视频（失败的视频使用 --retry-failed 重试）
+        run_id = state.find_run(section, unfinished=True)
+        if run_id is None:
+            logger.info("没有未完成的运行，开始新的运行")
+        else:
+            finished = {key for key, (item_state, _) in state.run_states(run_id).items()
+                        if item_state in RunState.DONE_STATES or item_state == 'failed'}
+            videos = [video for video in videos if video.rating_key not in finished]
+            logger.info(f"继续第 {run_id} 次运行，跳过 {enumerated - len(videos)} 个已处理的视频")
+    
+    if not args.dry_run:
+        if run_id is None:
+            if not args.resume and state.find_run(section, unfinished=True):
+                logger.info("上次运行未完成，可使用 --resume 跳过已处理的视频")
+            run_id = state.start_run(section)
+        updater.set_journal(state, run_id)
     
     if args.code:
         # 只处理特定番号
-        target_videos = []
-        for video in videos:
-            filename = Path(video.media[0].parts[0].file).name
-            if args.code.upper() in filename.upper():
-                target_videos.append(video)
-        videos = target_videos
+        videos = [video for video in videos if args.code.upper() in Path(video.file).name.upper()]
     
     logger.info(f"找到 {len(videos)} 个视频待处理")
     
+    # 批量预取详情页索引
+    prefetch_config = config.get('prefetch', {})
+    if args.prefetch or prefetch_config.get('enabled', False):
+        # 只预取需要爬取的视频（测试模式下所有视频都会爬取）
+        codes = JAVNumberExtractor.extract_many(Path(video.file).name for video in videos
+                                                if args.dry_run or PlexJAVUpdater.classify(video) == 'scrape')
+        resolved = scraper.prefetch(
+            [code for code in codes if code],
+            min_group=prefetch_config.get('min_group', 3),
+            max_pages=prefetch_config.get('max_pages', 20)
+        )
+        logger.info(f"预取完成，共解析 {resolved} 个番号的详情页地址")
+    
     if args.dry_run:
         logger.info("测试模式：只获取元数据，不更新 Plex")
     
-    # 处理视频
-    success_count = 0
-    failed_count = 0
-    results = []
+    engine_config = config.get('engine', {})
+    engine = args.engine or engine_config.get('type', 'threads')
+    success_count, failed_count, results = process_videos(
+        updater, videos, engine, engine_config, threads=args.threads, dry_run=args.dry_run
+    )
     
-    with ThreadPoolExecutor(max_workers=args.threads) as executor:
-        futures = {}
-        
-        for video in videos:
-            if not args.dry_run:
-                future = executor.submit(updater.process_video, video)
-                futures[future] = video
-            else:
-                # 测试模式：只获取元数据
-                filename = Path(video.media[0].parts[0].file).name
-                jav_code = JAVNumberExtractor.extract(filename)
-                if jav_code:
-                    future = executor.submit(scraper.search_by_code, jav_code)
-                    futures[future] = (filename, jav_code)
-        
-        # 使用进度条
-        with tqdm(total=len(futures), desc="处理进度") as pbar:
-            for future in as_completed(futures):
-                try:
-                    if not args.dry_run:
-                        filename, success, metadata = future.result()
-                        if success:
-                            success_count += 1
-                            results.append(f"✓ {filename}")
-                        else:
-                            failed_count += 1
-                            results.append(f"✗ {filename}")
-                    else:
-                        metadata = future.result()
-                        filename, jav_code = futures[future]
-                        if metadata:
-                            success_count += 1
-                            logger.info(f"找到 {jav_code}: {metadata['title']}, 类别: {', '.join(metadata['genres'])}")
-                        else:
-                            failed_count += 1
-                            logger.warning(f"未找到 {jav_code} 的信息")
-                    
-                except Exception as e:
-                    failed_count += 1
-                    logger.error(f"处理失败: {e}")
-                
-                pbar.update(1)
-                
-                # 只在实际请求JavLibrary时才延迟（跳过的视频不需要延迟）
-                if metadata and not (isinstance(metadata, dict) and metadata.get('action') in ['仅更新合集', '跳过已处理']):
-                    sleep_time = config.get('javlibrary', {}).get('rate_limit', 3.0)
-                    time.sleep(sleep_time)
+    if not args.watch:
+        close_resources()
+    
+    # 运行正常结束（中途崩溃时保持未完成状态，可用 --resume 继续）
+    failed_reasons = {}
+    if updater.journal:
+        state.finish_run(run_id)
+        updater.set_journal(None)
+        failed_reasons = {key: reason for key, (item_state, reason) in state.run_states(run_id).items()
+                          if item_state == 'failed'}
+    
+    # 只有处理完整个库（非测试模式、未使用 --limit/--code/--retry-failed）才推进高水位；
+    # 因请求失败（被拒绝、超时、写入 Plex 失败）而失败的视频没有被修改，updatedAt 不会变化，
+    # 高水位不能越过其中最早的一个，否则增量运行不会再列出它们
+    if enumerated and not (args.dry_run or args.limit or args.code or args.retry_failed):
+        failed_videos = [video for video in listed if video.rating_key in failed_reasons
+                         and failed_reasons[video.rating_key] not in RunState.PERMANENT_REASONS]
+        permanent_count = sum(reason in RunState.PERMANENT_REASONS for reason in failed_reasons.values())
+        if failed_count and not failed_reasons:
+            logger.warning("有视频处理失败但未找到对应记录，本次不更新增量高水位")
+        else:
+            if permanent_count:
+                logger.info(f"{permanent_count} 个视频无法识别番号或站点上没有，下次增量运行会按 ratingKey 重试")
+            if failed_videos:
+                new_watermark = (min(new_watermark[0], min(video.added_at for video in failed_videos)),
+                                 min(new_watermark[1], min(video.updated_at for video in failed_videos)))
+                logger.info(f"{len(failed_videos)} 个视频处理失败，增量高水位停在其中最早的更新时间，下次运行会重新处理")
+            state.set_watermark(section, *new_watermark)
+            logger.info(f"已更新增量高水位: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(new_watermark[1]))}")
+    state.close()
     
     # 输出统计
     logger.info("=" * 50)
@@ -912,6 +3142,26 @@ def main():
         logger.info("\n处理结果:")
         for result in results:
             logger.info(result)
+    
+    # 监听模式：先完成上面的（增量）扫描，再处理之后 Plex 扫描到的新视频
+    if args.watch:
+        watch_config = config.get('watch', {})
+        
+        def handle(rating_keys):
+            new_videos = updater.fetch_records(rating_keys)
+            succeeded, failed, _ = process_videos(
+                updater, new_videos, engine, engine_config, threads=args.threads, dry_run=args.dry_run
+            )
+            logger.info(f"新视频处理完成！成功: {succeeded}, 失败: {failed}")
+        
+        LibraryWatcher(
+            updater, handle,
+            debounce=watch_config.get('debounce', 5.0),
+            batch_size=watch_config.get('batch_size', 50),
+            max_wait=watch_config.get('max_wait', 60.0),
+            processed_states=watch_config.get('states', [5])
+        ).run()
+        close_resources()
 
 
 if __name__ == "__main__":